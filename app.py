@@ -1,6 +1,9 @@
 import os
+import tempfile
+import time
 from datetime import timedelta
 
+import click
 from dotenv import load_dotenv
 from flask import Flask, jsonify
 from flask_cors import CORS, cross_origin
@@ -8,15 +11,22 @@ from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from flask_smorest import Api
 
+import attachments
+import duplicates
+import events
 from blocklist import BLOCKLIST
-from db import db
+from db import db, engine_options, uses_queue_pool
+from instrumentation import TimedQueuePool, init_instrumentation
 from models import UserModel
+from resources.attachment import blp as AttachmentBlueprint
+from resources.event import blp as EventBlueprint
 from resources.flashcard import blp as FlashCardBlueprint
 from resources.tag import blp as TagBlueprint
 from resources.user import blp as UserBlueprint
 
 
-def create_app(db_url=None, debug=False):
+def create_app(db_url=None, debug=False, instrument=None):
+    started = time.perf_counter()
     app = Flask(__name__)
     load_dotenv()
 
@@ -34,11 +44,42 @@ def create_app(db_url=None, debug=False):
     # Use environment variables for database and JWT configurations
     app.config["SQLALCHEMY_DATABASE_URI"] = db_url or os.getenv("DATABASE_URL", "sqlite:///data.db")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Pool size, overflow, recycle and pre-ping come from DB_POOL_* environment variables
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
     app.config["DEBUG"] = debug
 
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "default-secret")  # Load from env var
     # Set access token expiration (e.g., 15 minutes)
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=1)
+
+    # Near-duplicate check on POST /flashcard (the index behind it is always maintained)
+    app.config["DUPLICATE_CHECK_ENABLED"] = os.getenv("DUPLICATE_CHECK_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config["DUPLICATE_SIMILARITY_THRESHOLD"] = float(os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", "0.5"))
+
+    # Content-addressed attachment store; mount a volume here in production
+    app.config["ATTACHMENT_DIR"] = os.getenv("ATTACHMENT_DIR", os.path.join(app.instance_path, "attachments"))
+    app.config["ATTACHMENT_MAX_BYTES"] = int(os.getenv("ATTACHMENT_MAX_BYTES", str(10 * 1024 * 1024)))
+    app.config["ATTACHMENT_CACHE_MAX_AGE"] = int(os.getenv("ATTACHMENT_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+
+    # Live change notifications on GET /events; see events.py for the brokers
+    app.config["EVENTS_BROKER"] = os.getenv("EVENTS_BROKER", "memory")
+    app.config["EVENTS_SOCKET_DIR"] = os.getenv("EVENTS_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "flashcards-events"))
+    app.config["EVENTS_HEARTBEAT_SECONDS"] = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+    app.config["EVENTS_MAX_STREAM_SECONDS"] = float(os.getenv("EVENTS_MAX_STREAM_SECONDS", "300"))
+    app.config["EVENTS_RETRY_MS"] = int(os.getenv("EVENTS_RETRY_MS", "2000"))
+    # Open streams per process; each one holds a server thread, so keep this below the thread count. 0 turns
+    # the route off when asgi.py serves GET /events
+    app.config["EVENTS_MAX_STREAMS"] = int(os.getenv("EVENTS_MAX_STREAMS", "3"))
+
+    # Opt-in request instrumentation (Server-Timing headers, request logs, /metrics)
+    if instrument is None:
+        instrument = os.getenv("INSTRUMENTATION_ENABLED", "false").lower() in ("1", "true", "yes")
+    app.config["INSTRUMENTATION_ENABLED"] = instrument
+    app.config["INSTRUMENTATION_N_PLUS_ONE_THRESHOLD"] = int(os.getenv("INSTRUMENTATION_N_PLUS_ONE_THRESHOLD", "5"))
+    # Bearer token the Prometheus scraper sends to GET /metrics; unset, the endpoint answers 404
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN")
+    if instrument and uses_queue_pool(app.config["SQLALCHEMY_DATABASE_URI"]):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"]["poolclass"] = TimedQueuePool
     
     CORS(app, resources={r"/*": {"origins": ["http://localhost:3000", "http://localhost:5000"]}})
     
@@ -84,6 +125,26 @@ def create_app(db_url=None, debug=False):
     def missing_token_callback(error):
         return jsonify({"message": "Request does not contain an access token.", "error": "authorization_required"}), 401
 
+    if app.config["INSTRUMENTATION_ENABLED"]:
+        init_instrumentation(app, jwt)
+
+    @app.cli.command("reindex-duplicates")
+    def reindex_duplicates():
+        """Rebuild the near-duplicate index of every flashcard."""
+        duplicates.reindex_all()
+
+    @app.cli.command("gc-attachments")
+    @click.option("--grace", default=3600, help="Keep unreferenced blobs younger than this many seconds.")
+    def gc_attachments(grace):
+        """Delete stored attachment blobs that no attachment references."""
+        click.echo(f"Removed {attachments.collect_garbage(grace)} blob(s).")
+
+    @app.cli.command("prune-events")
+    @click.option("--older-than", default=24 * 3600, help="Delete events older than this many seconds.")
+    def prune_events(older_than):
+        """Delete old change events; streams resuming from before them are told to reload."""
+        click.echo(f"Removed {events.prune(older_than)} event(s).")
+
     # Initialize database with the app context
     # with app.app_context():
     #     db.create_all()
@@ -92,6 +153,11 @@ def create_app(db_url=None, debug=False):
     api.register_blueprint(FlashCardBlueprint)
     api.register_blueprint(TagBlueprint)
     api.register_blueprint(UserBlueprint)
+    api.register_blueprint(AttachmentBlueprint)
+    api.register_blueprint(EventBlueprint)
+
+    app.extensions["startup_seconds"] = time.perf_counter() - started
+    app.logger.info("App created in %.1f ms", app.extensions["startup_seconds"] * 1000)
 
     return app
 
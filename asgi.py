@@ -0,0 +1,281 @@
+"""
+asgi.py
+
+Optional ASGI entry point for the read-heavy endpoints and the event stream:
+
+    GET /flashcard
+    GET /tag
+    GET /flashcard/<id>/tag
+    GET /events
+
+They are served with async SQLAlchemy sessions (aiosqlite or asyncpg), so a single worker keeps hundreds of
+reads in flight while they wait on the database instead of blocking one thread each. An open event stream
+is one coroutine waiting on the broker, so streams never tie up the threads of the WSGI workers. Tokens go
+through the JWTManager of a regular create_app() instance, so validation, the blocklist and the error
+responses are the ones the Flask app uses, and responses are dumped with the same schemas.
+
+    uvicorn --factory asgi:create_asgi_app --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker "asgi:create_asgi_app()"
+
+Everything else (writes, login, users) stays on app:create_app(); put both behind a proxy that sends these
+GET routes here. Needs the packages in requirements-async.txt.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.pool import StaticPool
+
+import events
+from app import create_app
+from db import db, engine_options, uses_queue_pool
+from models import FlashCardModel, FlashCardsTags, TagModel
+from schemas import FlashCardSchema, TagSchema
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url):
+    """Swap the driver of a sync SQLAlchemy URL for its asyncio counterpart."""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases.")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncReadApp:
+    """Minimal ASGI application for the read endpoints; see the module docstring."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+
+        # Use the engine URL Flask-SQLAlchemy resolved (relative SQLite paths point into the instance folder).
+        with flask_app.app_context():
+            url = async_database_url(db.engine.url)
+
+        options = engine_options(url)
+        if not uses_queue_pool(url):
+            options["poolclass"] = StaticPool
+        self.engine = create_async_engine(url, **options)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        self.routes = [
+            (re.compile(r"^/flashcard$"), self.list_flashcards),
+            (re.compile(r"^/tag$"), self.list_tags),
+            (re.compile(r"^/flashcard/(?P<flashcard_id>[^/]+)/tag$"), self.list_flashcard_tags),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == "/events":
+            await self.stream_events(scope, receive, send)
+        elif scope["type"] == "http":
+            status, body = await self._dispatch(scope)
+            await _send_json(send, status, body, head=scope["method"] == "HEAD")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                events.close_broker(self.flask_app)
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _dispatch(self, scope):
+        for pattern, handler in self.routes:
+            match = pattern.match(scope["path"])
+            if match is None:
+                continue
+            if scope["method"] not in ("GET", "HEAD"):
+                return 405, _error_body(405, "Method Not Allowed")
+
+            identity, _, error = self._authenticate(scope)
+            if error is not None:
+                return error
+            return await handler(identity, **match.groupdict())
+
+        return 404, _error_body(404, "Not Found")
+
+    def _authenticate(self, scope, locations=None):
+        """Run the Flask app's JWT checks; returns (identity, claims, None) or (None, None, (status, body))."""
+        headers = [(key.decode("latin-1"), value.decode("latin-1")) for key, value in scope["headers"]]
+        query_string = scope.get("query_string", b"").decode("latin-1")
+        with self.flask_app.test_request_context(scope["path"], headers=headers, query_string=query_string):
+            try:
+                verify_jwt_in_request(locations=locations)
+                return get_jwt_identity(), get_jwt(), None
+            except Exception as e:  # pylint: disable=broad-except
+                # Reuse the JWTManager error handlers so failures look exactly like the Flask app's
+                response = self.flask_app.make_response(self.flask_app.handle_user_exception(e))
+                return None, None, (response.status_code, response.get_data())
+
+    async def stream_events(self, scope, receive, send):
+        """The GET /events stream of resources/event.py, with a coroutine per client instead of a thread."""
+        if scope["method"] != "GET":
+            await _send_json(send, 405, _error_body(405, "Method Not Allowed"), head=scope["method"] == "HEAD")
+            return
+
+        # EventSource cannot set headers, so browsers pass the access token as ?jwt=...
+        identity, claims, error = self._authenticate(scope, locations=["headers", "query_string"])
+        if error is not None:
+            await _send_json(send, *error)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        header = dict(scope["headers"]).get(b"last-event-id", b"").decode("latin-1")
+        try:
+            start = events.StreamStart(header, query.get("last_event_id", [None])[0], claims, self.flask_app.config)
+        except ValueError:
+            await _send_json(send, 400, _error_body(400, "Bad Request", "Last-Event-ID must be an event id."))
+            return
+
+        # Subscribe before reading the history so nothing committed in between is missed
+        subscription = events.get_broker(self.flask_app).subscribe(identity, events.AsyncSubscription)
+        try:
+            async with self.sessions() as session:
+                row = (await session.execute(start.query(self.engine.dialect.name))).one()
+            last_event_id, reset = start.resume(row)
+
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            })
+            streaming = asyncio.ensure_future(
+                self._send_events(send, subscription, last_event_id, start.duration, reset)
+            )
+            disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+            done, pending = await asyncio.wait({streaming, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if streaming in done:
+                streaming.result()
+        finally:
+            subscription.close()
+
+    async def _send_events(self, send, subscription, last_event_id, duration, reset):
+        config = self.flask_app.config
+        deadline = time.monotonic() + duration
+        cursor = events.StreamCursor(subscription.user_id, last_event_id)
+        await _send_chunk(send, "".join(events.opening_frames(config["EVENTS_RETRY_MS"], last_event_id, reset)))
+
+        while True:
+            # A short session per read, so an idle stream does not hold a pooled connection
+            async with self.sessions() as session:
+                rows = (await session.execute(cursor.query())).all()
+            frames = cursor.frames(rows)
+            if frames:
+                await _send_chunk(send, "".join(frames))
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not await subscription.wait(min(config["EVENTS_HEARTBEAT_SECONDS"], remaining)):
+                await _send_chunk(send, events.KEEP_ALIVE)
+        await send({"type": "http.response.body", "body": b""})
+
+    async def list_flashcards(self, user_id):
+        async with self.sessions() as session:
+            result = await session.execute(
+                select(FlashCardModel)
+                .filter_by(user_id=user_id)
+                .options(
+                    joinedload(FlashCardModel.tags),
+                    joinedload(FlashCardModel.user),
+                    selectinload(FlashCardModel.attachments),
+                )
+            )
+            return 200, FlashCardSchema(many=True).dump(result.unique().scalars().all())
+
+    async def list_tags(self, user_id):
+        async with self.sessions() as session:
+            result = await session.execute(
+                select(TagModel).filter_by(user_id=user_id).options(selectinload(TagModel.flashcards))
+            )
+            return 200, TagSchema(many=True).dump(result.scalars().all())
+
+    async def list_flashcard_tags(self, user_id, flashcard_id):
+        try:
+            flashcard_id = uuid.UUID(flashcard_id)
+        except ValueError:
+            return 404, _error_body(404, "Not Found")
+
+        async with self.sessions() as session:
+            if await session.get(FlashCardModel, flashcard_id) is None:
+                return 404, _error_body(404, "Not Found")
+
+            result = await session.execute(
+                select(TagModel)
+                .join(FlashCardsTags, FlashCardsTags.tag_id == TagModel.id)
+                .filter(FlashCardsTags.flashcard_id == flashcard_id)
+                .options(selectinload(TagModel.flashcards))
+            )
+            return 200, TagSchema(many=True).dump(result.scalars().all())
+
+
+def _error_body(code, status, message=None):
+    # Same shape flask-smorest uses for HTTP errors
+    body = {"code": code, "status": status}
+    if message is not None:
+        body["message"] = message
+    return body
+
+
+async def _send_json(send, status, body, head=False):
+    """Send a JSON response; for HEAD only the headers, with the Content-Length the GET body would have."""
+    payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": b"" if head else payload})
+
+
+class RedactTokens(logging.Filter):
+    """Keep the access tokens EventSource clients pass as ?jwt= on GET /events out of uvicorn's access log."""
+
+    def filter(self, record):
+        if isinstance(record.args, tuple):
+            record.args = tuple(events.redact_token(arg) if isinstance(arg, str) else arg for arg in record.args)
+        return True
+
+
+async def _send_chunk(send, text):
+    await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def create_asgi_app(db_url=None, flask_app=None):
+    if flask_app is None:
+        # Writes happen in the WSGI workers; their wakeups reach this process through the socket broker
+        os.environ.setdefault("EVENTS_BROKER", "socket")
+    access_log = logging.getLogger("uvicorn.access")
+    if not any(isinstance(existing, RedactTokens) for existing in access_log.filters):
+        access_log.addFilter(RedactTokens())
+    return AsyncReadApp(flask_app or create_app(db_url))
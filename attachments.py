@@ -0,0 +1,202 @@
+"""
+attachments.py
+
+Content-addressed blob store for flashcard attachments. Uploads are read from the request stream in chunks,
+hashed while they are written to a temporary file and then renamed to `<root>/<sha[:2]>/<sha[2:4]>/<sha>`, so
+identical files are stored once no matter how many cards use them and no upload is ever held in memory.
+
+Rows in `attachments` only carry metadata. Deleting a row never removes the blob right away: another upload
+of the same bytes may be linking it at that moment. `flask gc-attachments` removes blobs that no row
+references and that have not been touched for a grace period instead. Uploads hold a shared lock on the
+store from linking their blob until their row is committed, and the collector takes it exclusively around
+its last check and the delete, so it never removes a blob that a committed row points to. Each upload also
+flocks its temporary file until it is linked, so the collector only removes those of uploads that died.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import select
+
+from db import db
+from models import AttachmentModel, FlashCardModel
+
+CHUNK_SIZE = 64 * 1024
+LOCK_FILE = "gc.lock"
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    @contextmanager
+    def lock(self, exclusive=False):
+        """flock on a file in the store: shared while uploads link blobs, exclusive while blobs are removed."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def upload(self, stream, max_bytes):
+        """
+        Like save(), but yields (sha256, size) with the shared lock held from linking the blob on. Commit the row
+        that references the blob before leaving the block. The stream is read before the lock is taken, so a
+        slow client never holds up garbage collection.
+        """
+        tmp, tmp_path, sha256, size = self._receive(stream, max_bytes)
+        with self.lock():
+            self._link(tmp, tmp_path, sha256)
+            yield sha256, size
+
+    def save(self, stream, max_bytes):
+        """Copy `stream` into the store; returns (sha256, size). Raises BlobTooLarge past `max_bytes`."""
+        tmp, tmp_path, sha256, size = self._receive(stream, max_bytes)
+        self._link(tmp, tmp_path, sha256)
+        return sha256, size
+
+    def _receive(self, stream, max_bytes):
+        """
+        Copy `stream` into a temporary file while hashing it; returns (open file, its path, sha256, size). The file
+        stays flocked until _link() closes it, so collect_garbage() leaves it alone however slow the client is.
+        """
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest, size = hashlib.sha256(), 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        tmp = os.fdopen(fd, "wb")
+        try:
+            fcntl.flock(tmp, fcntl.LOCK_EX)
+            while chunk := stream.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise BlobTooLarge()
+                digest.update(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+        except BaseException:
+            os.unlink(tmp_path)
+            tmp.close()
+            raise
+        return tmp, tmp_path, digest.hexdigest(), size
+
+    def _link(self, tmp, tmp_path, sha256):
+        try:
+            target = self.path(sha256)
+            if os.path.exists(target):
+                # Already stored; refresh the mtime so garbage collection leaves it alone
+                os.utime(target)
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)  # Atomic, so readers never see a partial blob
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        finally:
+            tmp.close()  # Releases the flock
+
+    def exists(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def mtime(self, sha256):
+        """When the blob was last stored or re-uploaded; None if it is gone."""
+        try:
+            return os.path.getmtime(self.path(sha256))
+        except FileNotFoundError:
+            return None
+
+    def stored(self):
+        """Yield (sha256, mtime) of every stored blob."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                # Only the lock file lives at the top, and tmp holds unfinished uploads
+                dirnames[:] = [dirname for dirname in dirnames if dirname != "tmp"]
+                continue
+            for filename in filenames:
+                yield filename, os.path.getmtime(os.path.join(dirpath, filename))
+
+    def delete(self, sha256):
+        try:
+            os.unlink(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def remove_abandoned_uploads(self, cutoff):
+        """Delete temporary files last written before `cutoff` whose upload no longer holds their flock."""
+        tmp_dir = os.path.join(self.root, "tmp")
+        if not os.path.isdir(tmp_dir):
+            return
+        for entry in os.scandir(tmp_dir):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                with open(entry.path, "rb") as tmp:
+                    try:
+                        fcntl.flock(tmp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # A slow client is still sending it
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass  # Linked into the store or cleaned up since the scan
+
+
+def get_store():
+    return BlobStore(current_app.config["ATTACHMENT_DIR"])
+
+
+def detach_flashcard(flashcard_id):
+    """Drop the attachment rows of a flashcard; the blobs are left to collect_garbage()."""
+    AttachmentModel.query.filter_by(flashcard_id=flashcard_id).delete(synchronize_session=False)
+
+
+def detach_user(user_id):
+    flashcard_ids = select(FlashCardModel.id).where(FlashCardModel.user_id == user_id)
+    AttachmentModel.query.filter(AttachmentModel.flashcard_id.in_(flashcard_ids)).delete(synchronize_session=False)
+
+
+def _is_referenced(sha256):
+    db.session.rollback()  # End the read transaction so rows committed since the scan are visible
+    return db.session.execute(
+        select(AttachmentModel.id).where(AttachmentModel.sha256 == sha256).limit(1)
+    ).first() is not None
+
+
+def collect_garbage(grace_seconds=3600):
+    """Delete blobs no attachment references that are older than the grace period. Returns how many."""
+    store = get_store()
+    referenced = set(db.session.execute(select(AttachmentModel.sha256).distinct()).scalars())
+    cutoff = time.time() - grace_seconds
+
+    removed = 0
+    for sha256, mtime in list(store.stored()):
+        if sha256 in referenced or mtime >= cutoff:
+            continue
+        # An upload of the same bytes may have linked the blob since the scan; look again right before deleting,
+        # with uploads shut out until the blob is gone
+        with store.lock(exclusive=True):
+            mtime = store.mtime(sha256)
+            if mtime is None or mtime >= cutoff or _is_referenced(sha256):
+                continue
+            store.delete(sha256)
+        removed += 1
+
+    # Temporary files of uploads that died halfway
+    store.remove_abandoned_uploads(cutoff)
+    return removed
@@ -0,0 +1,131 @@
+"""
+Command line entry point for the benchmark suite. Run from the repository root:
+
+    python -m benchmarks endpoints --users 20 --cards-per-user 500
+    python -m benchmarks load --concurrency 16 --duration 30
+    python -m benchmarks async-reads --concurrency 200 --duration 30
+    python -m benchmarks compare benchmarks/results/endpoints-abc1234-....json benchmarks/results/endpoints-def5678-....json
+
+endpoints, load and async-reads default to a fresh temporary SQLite database; pass --db-url to use a local Postgres
+instead (its tables are dropped and recreated).
+"""
+import argparse
+import json
+import logging
+import sys
+
+from benchmarks.async_reads import run_async_comparison
+from benchmarks.common import build_app, save_results
+from benchmarks.compare import compare, format_rows
+from benchmarks.endpoints import run_endpoints
+from benchmarks.load import run_load
+from benchmarks.seed import seed
+
+
+def _add_dataset_arguments(parser):
+    parser.add_argument("--db-url", help="Database URL (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--cards-per-user", type=int, default=100)
+    parser.add_argument("--tags-per-user", type=int, default=10)
+    parser.add_argument("--tags-per-card", type=int, default=2)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0,
+                        help="Share of cards that reword an earlier card of the same user")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Enable request instrumentation and record query counts")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/)")
+
+
+def _dataset_params(args):
+    return {
+        "db": (args.db_url or "sqlite").split(":", 1)[0],
+        "users": args.users,
+        "cards_per_user": args.cards_per_user,
+        "tags_per_user": args.tags_per_user,
+        "tags_per_card": args.tags_per_card,
+        "duplicate_ratio": args.duplicate_ratio,
+        "seed": args.seed,
+        "instrument": args.instrument,
+    }
+
+
+def _prepare(args):
+    app = build_app(args.db_url, instrument=args.instrument)
+    dataset = seed(
+        app,
+        users=args.users,
+        cards_per_user=args.cards_per_user,
+        tags_per_user=args.tags_per_user,
+        tags_per_card=args.tags_per_card,
+        duplicate_ratio=args.duplicate_ratio,
+        random_seed=args.seed,
+    )
+    return app, dataset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Flash Cards API benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    endpoints = commands.add_parser("endpoints", help="Micro-benchmark every endpoint")
+    _add_dataset_arguments(endpoints)
+    endpoints.add_argument("--iterations", type=int, default=200)
+    endpoints.add_argument("--warmup", type=int, default=10)
+    endpoints.add_argument("--only", action="append", help="Only run cases whose name contains this text")
+
+    load = commands.add_parser("load", help="Concurrent load against a local or running server")
+    _add_dataset_arguments(load)
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    load.add_argument("--requests", type=int, help="Stop after this many requests")
+    load.add_argument("--url", help="Base URL of an already running server using the same database")
+
+    async_reads = commands.add_parser("async-reads", help="Read load on the sync app vs the ASGI read path")
+    _add_dataset_arguments(async_reads)
+    async_reads.add_argument("--concurrency", type=int, default=64)
+    async_reads.add_argument("--duration", type=float, default=10.0, help="Seconds to run each path")
+    async_reads.add_argument("--requests", type=int, help="Stop each path after this many requests")
+    async_reads.add_argument("--sync-url", help="Base URL of a running sync server using the same database")
+    async_reads.add_argument("--async-url", help="Base URL of a running ASGI server using the same database")
+
+    diff = commands.add_parser("compare", help="Diff two saved runs")
+    diff.add_argument("baseline")
+    diff.add_argument("candidate")
+    diff.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as a regression")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        rows, regressions = compare(args.baseline, args.candidate, args.threshold)
+        print(format_rows(rows))
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            return 1
+        return 0
+
+    # Per-request log lines would swamp the output.
+    logging.getLogger("flashcards.instrumentation").setLevel(logging.WARNING)
+
+    app, dataset = _prepare(args)
+    params = _dataset_params(args)
+
+    if args.command == "endpoints":
+        params.update(iterations=args.iterations, warmup=args.warmup)
+        results = run_endpoints(app, dataset, iterations=args.iterations, warmup=args.warmup, only=args.only)
+    elif args.command == "load":
+        params.update(concurrency=args.concurrency, duration=args.duration, requests=args.requests)
+        results = run_load(app, dataset, concurrency=args.concurrency, duration=args.duration,
+                           max_requests=args.requests, url=args.url, random_seed=args.seed)
+    else:
+        params.update(concurrency=args.concurrency, duration=args.duration, requests=args.requests)
+        results = run_async_comparison(app, dataset, concurrency=args.concurrency, duration=args.duration,
+                                       max_requests=args.requests, sync_url=args.sync_url,
+                                       async_url=args.async_url, random_seed=args.seed)
+
+    print(json.dumps(results, indent=2))
+    print(f"Saved to {save_results(args.command, params, results, args.output)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+async_reads.py
+
+Compare the sync Flask app with the async read path in asgi.py under the same concurrent read load. Both
+serve the same seeded database; by default the sync app runs on the threaded local server and the ASGI app on
+an in-process uvicorn, or point `--sync-url` / `--async-url` at real deployments (gunicorn vs uvicorn workers).
+"""
+import socket
+import threading
+import time
+
+from asgi import create_asgi_app
+from benchmarks.load import ASYNC_READ_MIX, run_load
+
+
+class UvicornServer:
+    """Serve an ASGI app with uvicorn from a background thread on a free local port."""
+
+    def __init__(self, asgi_app):
+        import uvicorn
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def run_async_comparison(app, dataset, concurrency=64, duration=10.0, max_requests=None, sync_url=None,
+                         async_url=None, random_seed=0):
+    """Run the read mix against both paths and return {"sync": load results, "async": load results}."""
+    options = dict(concurrency=concurrency, duration=duration, max_requests=max_requests, mix=ASYNC_READ_MIX,
+                   random_seed=random_seed)
+    results = {"sync": run_load(app, dataset, url=sync_url, **options)}
+
+    if async_url:
+        results["async"] = run_load(app, dataset, url=async_url, **options)
+    else:
+        with UvicornServer(create_asgi_app(flask_app=app)) as server:
+            results["async"] = run_load(app, dataset, url=server.url, **options)
+    return results
@@ -0,0 +1,95 @@
+"""
+common.py
+
+Shared helpers for the benchmark suite: building an app against a throwaway database, latency statistics
+and saving results as JSON so runs from different commits can be diffed with `python -m benchmarks compare`.
+"""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+
+from app import create_app
+from db import db
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def build_app(db_url=None, instrument=False, reset=True):
+    """Create the app against `db_url` (a temporary SQLite file by default) with a fresh schema."""
+    if db_url is None:
+        db_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="flashcards-bench-"), "bench.db")
+
+    app = create_app(db_url, instrument=instrument)
+    # Benchmarks run longer than the production token lifetime.
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
+    app.config["ATTACHMENT_DIR"] = tempfile.mkdtemp(prefix="flashcards-bench-attachments-")
+
+    with app.app_context():
+        if reset:
+            db.drop_all()
+        db.create_all()
+    return app
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, elapsed=None):
+    """Latency summary in milliseconds; adds throughput when the wall-clock `elapsed` seconds is given."""
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else None,
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(values[-1] if values else None),
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(values) / elapsed, 2)
+    return summary
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(kind, params, results, output=None):
+    """Write a benchmark run to JSON and return the path."""
+    revision = git_revision()
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{kind}-{revision or 'unknown'}-{int(time.time())}.json")
+
+    document = {
+        "kind": kind,
+        "revision": revision,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return output
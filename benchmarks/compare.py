@@ -0,0 +1,57 @@
+"""
+compare.py
+
+Diff two saved benchmark runs. Latency percentiles that got slower by more than the threshold are reported
+as regressions.
+"""
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "queries_mean")
+
+
+def _flatten_load(prefix, results):
+    flat = {f"{prefix} {name}": summary for name, summary in results["endpoints"].items()}
+    flat[f"{prefix} overall"] = results["overall"]
+    return flat
+
+
+def _flatten(document):
+    # Endpoint runs map case -> summary; load runs nest the per-endpoint summaries one level down,
+    # and async-vs-sync runs hold one load run per mode.
+    results = document["results"]
+    if "overall" in results:
+        return _flatten_load("load", results)
+    if results and all("overall" in run for run in results.values()):
+        flat = {}
+        for mode, run in results.items():
+            flat.update(_flatten_load(mode, run))
+        return flat
+    return results
+
+
+def compare(baseline_path, candidate_path, threshold=0.10):
+    """Return (rows, regressions); each row is (case, metric, baseline, candidate, relative change)."""
+    with open(baseline_path) as f:
+        baseline = _flatten(json.load(f))
+    with open(candidate_path) as f:
+        candidate = _flatten(json.load(f))
+
+    rows, regressions = [], []
+    for case in sorted(set(baseline) & set(candidate)):
+        for metric in METRICS:
+            before, after = baseline[case].get(metric), candidate[case].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            row = (case, metric, before, after, change)
+            rows.append(row)
+            if change > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def format_rows(rows):
+    lines = [f"{'case':<36} {'metric':<13} {'before':>10} {'after':>10} {'change':>8}"]
+    for case, metric, before, after, change in rows:
+        lines.append(f"{case:<36} {metric:<13} {before:>10.3f} {after:>10.3f} {change:>+8.1%}")
+    return "\n".join(lines)
@@ -0,0 +1,158 @@
+"""
+endpoints.py
+
+Micro-benchmarks for every route in resources/. Each case prepares its own request (creating whatever rows a
+destructive call needs, outside the timed section) and is then timed through the Flask test client, so the
+numbers cover routing, JWT checks, queries and serialization but not network I/O.
+"""
+import io
+import time
+import uuid
+
+from flask_jwt_extended import create_access_token, create_refresh_token
+
+import attachments
+from benchmarks.common import summarize
+from db import db
+from models import AttachmentModel, FlashCardModel, TagModel, UserModel
+
+
+def _auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _cases(dataset):
+    """Yield (name, prepare) pairs; prepare(i) returns (method, url, json_body, headers)."""
+    user = dataset["users"][0]
+    headers = _auth(user["token"])
+    card_id = user["card_ids"][0]
+    tag_id = user["tag_ids"][0]
+    run = uuid.uuid4().hex[:8]
+
+    def new_card(i):
+        card = FlashCardModel(question=f"bench {run} card {i}", answer="a", user_id=user["id"])
+        db.session.add(card)
+        db.session.commit()
+        return card
+
+    def new_tag(i, prefix="bench"):
+        tag = TagModel(name=f"{prefix}-{run}-{i}", user_id=user["id"])
+        db.session.add(tag)
+        db.session.commit()
+        return tag
+
+    stored = []
+
+    def attachment_id(i):
+        # One 256 KiB attachment, created the first time the case runs
+        if not stored:
+            sha256, size = attachments.get_store().save(io.BytesIO(bytes(256 * 1024)), max_bytes=256 * 1024)
+            row = AttachmentModel(flashcard_id=uuid.UUID(card_id), sha256=sha256, size=size, content_type="image/png")
+            db.session.add(row)
+            db.session.commit()
+            stored.append(row.id)
+        return stored[0]
+
+    # Users
+    yield "POST /register", lambda i: ("post", "/register",
+                                       {"username": f"bench-{run}-{i}", "password": "secret"}, {})
+    yield "POST /login", lambda i: ("post", "/login",
+                                    {"username": user["username"], "password": dataset["password"]}, {})
+
+    # Refresh and logout blocklist the token they are called with, so every call needs a new one.
+    yield "POST /refresh", lambda i: ("post", "/refresh", None,
+                                      _auth(create_refresh_token(identity=user["id"])))
+    yield "POST /logout", lambda i: ("post", "/logout", None,
+                                     _auth(create_access_token(identity=user["id"], fresh=True)))
+    yield "GET /user/<id>", lambda i: ("get", f"/user/{user['id']}", None, headers)
+
+    def delete_user(i):
+        doomed = UserModel(username=f"bench-doomed-{run}-{i}", password="x")
+        db.session.add(doomed)
+        db.session.commit()
+        return "delete", f"/user/{doomed.id}", None, _auth(create_access_token(identity=doomed.id))
+
+    yield "DELETE /user/<id>", delete_user
+
+    # Flashcards
+    yield "GET /flashcard", lambda i: ("get", "/flashcard", None, headers)
+    yield "POST /flashcard", lambda i: ("post", "/flashcard", {
+        "question": f"bench {run} posted {i}",
+        "answer": "a",
+        "tags": user["tag_names"][:2],
+    }, headers)
+    yield "GET /flashcard/random", lambda i: ("get", "/flashcard/random?n=20", None, headers)
+    yield "GET /flashcard/random?tag", lambda i: ("get", f"/flashcard/random?n=20&tag={tag_id}", None, headers)
+    yield "GET /flashcard/duplicates", lambda i: ("get", "/flashcard/duplicates", None, headers)
+    yield "GET /flashcard/<id>", lambda i: ("get", f"/flashcard/{card_id}", None, headers)
+    yield "PUT /flashcard/<id>", lambda i: ("put", f"/flashcard/{card_id}", {"answer": f"answer {i}"}, headers)
+    yield "DELETE /flashcard/<id>", lambda i: ("delete", f"/flashcard/{new_card(i).id}", None, headers)
+
+    yield "GET /attachment/<id>", lambda i: ("get", f"/attachment/{attachment_id(i)}", None, headers)
+
+    # Tags
+    yield "GET /tag", lambda i: ("get", "/tag", None, headers)
+    yield "POST /tag", lambda i: ("post", "/tag", {"name": f"bench-{run}-posted-{i}"}, headers)
+    yield "GET /tag/<id>", lambda i: ("get", f"/tag/{tag_id}", None, headers)
+    yield "DELETE /tag/<id>", lambda i: ("delete", f"/tag/{new_tag(i, 'unused').id}", None, headers)
+    yield "GET /flashcard/<id>/tag", lambda i: ("get", f"/flashcard/{card_id}/tag", None, headers)
+
+    # The tag is looked up by name, so make sure one exists that is not yet linked to the card.
+    yield "POST /flashcard/<id>/tag", lambda i: ("post", f"/flashcard/{card_id}/tag",
+                                                 {"name": new_tag(i, "by-name").name}, headers)
+    yield "POST /flashcard/<id>/tag/<id>", lambda i: ("post", f"/flashcard/{card_id}/tag/{new_tag(i, 'link').id}",
+                                                      None, headers)
+
+    def unlink(i):
+        card = new_card(f"unlink-{i}")
+        tag = new_tag(i, "unlink")
+        card.tags.append(tag)
+        db.session.commit()
+        return "delete", f"/flashcard/{card.id}/tag/{tag.id}", None, headers
+
+    yield "DELETE /flashcard/<id>/tag/<id>", unlink
+
+
+def _query_count(response):
+    # Only present when the app was built with instrumentation enabled.
+    timing = response.headers.get("Server-Timing", "")
+    for entry in timing.split(","):
+        if entry.strip().startswith("db;"):
+            return int(entry.split('desc="')[1].split(" ")[0])
+    return None
+
+
+def run_endpoints(app, dataset, iterations=200, warmup=10, only=None):
+    """Time every endpoint case and return {case name: summary}."""
+    client = app.test_client()
+    results = {}
+
+    for name, prepare in _cases(dataset):
+        if only and not any(pattern in name for pattern in only):
+            continue
+
+        latencies, statuses, queries = [], {}, []
+        for i in range(warmup + iterations):
+            with app.app_context():
+                method, url, body, headers = prepare(i)
+
+            started = time.perf_counter()
+            response = getattr(client, method)(url, json=body, headers=headers)
+            elapsed = time.perf_counter() - started
+
+            if i < warmup:
+                continue
+            latencies.append(elapsed)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            count = _query_count(response)
+            if count is not None:
+                queries.append(count)
+
+        summary = summarize(latencies)
+        summary["status_codes"] = statuses
+        if queries:
+            summary["queries_mean"] = round(sum(queries) / len(queries), 2)
+            summary["queries_max"] = max(queries)
+        results[name] = summary
+
+    return results
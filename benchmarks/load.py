@@ -0,0 +1,116 @@
+"""
+load.py
+
+Concurrent load driver. Worker threads replay a weighted mix of read requests for random seeded users against
+a real HTTP server: a threaded local server wrapping the app by default, or any running instance given by
+`--url` (for example gunicorn started against the same database and JWT_SECRET_KEY).
+"""
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks.common import summarize
+
+# (weight, name, url template) - templates are filled with a random card/tag of the chosen user
+DEFAULT_MIX = (
+    (4, "GET /flashcard", "/flashcard"),
+    (3, "GET /tag", "/tag"),
+    (2, "GET /flashcard/<id>", "/flashcard/{card_id}"),
+    (1, "GET /flashcard/<id>/tag", "/flashcard/{card_id}/tag"),
+)
+
+# The endpoints the ASGI read path (asgi.py) serves
+ASYNC_READ_MIX = tuple(entry for entry in DEFAULT_MIX if entry[1] != "GET /flashcard/<id>")
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class LocalServer:
+    """Serve `app` from a background thread on a free local port."""
+
+    def __init__(self, app):
+        self._server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=_QuietHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def _worker(base_url, dataset, mix, deadline, max_requests, counter, lock, samples, random_seed):
+    rng = random.Random(random_seed)
+    weights = [weight for weight, _, _ in mix]
+
+    while time.perf_counter() < deadline:
+        with lock:
+            if max_requests is not None and counter[0] >= max_requests:
+                return
+            counter[0] += 1
+
+        user = rng.choice(dataset["users"])
+        _, name, template = rng.choices(mix, weights=weights)[0]
+        url = base_url + template.format(
+            card_id=rng.choice(user["card_ids"]) if user["card_ids"] else "",
+            tag_id=rng.choice(user["tag_ids"]) if user["tag_ids"] else "",
+        )
+        req = urllib.request.Request(url, headers={"Authorization": f"Bearer {user['token']}"})
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        samples.append((name, status, time.perf_counter() - started))
+
+
+def run_load(app, dataset, concurrency=8, duration=10.0, max_requests=None, url=None, mix=DEFAULT_MIX,
+             random_seed=0):
+    """Drive load for `duration` seconds (or until `max_requests`) and return overall and per-endpoint stats."""
+    samples = []  # list.append is atomic, so workers share it without a lock
+    counter, lock = [0], threading.Lock()
+
+    def drive(base_url):
+        deadline = time.perf_counter() + duration
+        threads = [
+            threading.Thread(
+                target=_worker,
+                args=(base_url, dataset, mix, deadline, max_requests, counter, lock, samples, random_seed + n),
+            )
+            for n in range(concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    if url:
+        elapsed = drive(url.rstrip("/"))
+    else:
+        with LocalServer(app) as server:
+            elapsed = drive(server.url)
+
+    ok = [latency for _, status, latency in samples if 200 <= status < 400]
+    results = {"overall": summarize(ok, elapsed), "errors": len(samples) - len(ok), "endpoints": {}}
+    for _, name, _ in mix:
+        latencies = [latency for sample_name, status, latency in samples
+                     if sample_name == name and 200 <= status < 400]
+        results["endpoints"][name] = summarize(latencies, elapsed)
+    return results
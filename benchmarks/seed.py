@@ -0,0 +1,121 @@
+"""
+seed.py
+
+Synthetic data generator. Inserts users, their flashcards and tags, and links every card to a number of the
+owner's tags. Questions are random made-up words, optionally with a share of reworded near-duplicates, and are
+added to the near-duplicate index. Rows are written with bulk INSERTs and a fixed random seed keeps datasets
+identical between runs.
+"""
+import random
+import uuid
+from functools import lru_cache
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+from db import db
+from duplicates import bucket_rows
+from models import (FlashCardModel, FlashCardsTags, QuestionBucketModel,
+                    TagModel, UserModel)
+from resources.user import bcrypt
+
+PASSWORD = "bench-password"
+BATCH_SIZE = 5000
+
+
+@lru_cache(maxsize=None)
+def _password_hash():
+    return bcrypt.generate_password_hash(PASSWORD).decode("utf-8")
+
+
+def _vocabulary(rng, size=500):
+    syllables = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+    return sorted({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(size)})
+
+
+def _question(rng, vocabulary):
+    return " ".join(rng.choices(vocabulary, k=rng.randint(4, 8))).capitalize() + "?"
+
+
+def _reword(rng, question):
+    # Same words in a different order plus a filler word: a typical re-imported duplicate
+    words = question.rstrip("?").lower().split()
+    rng.shuffle(words)
+    return "What is " + " ".join(words) + "?"
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def seed(app, users=10, cards_per_user=100, tags_per_user=10, tags_per_card=2, duplicate_ratio=0.0, random_seed=0):
+    """
+    Populate the database of `app` and return a description of what was created:
+
+        {"password": ..., "users": [{"id", "username", "token", "card_ids", "tag_ids", "tag_names"}, ...]}
+
+    Every user shares the same password (hashed once per process) and gets an access token minted directly,
+    so seeding does not pay for a bcrypt round per user. About `duplicate_ratio` of the cards reword an
+    earlier card of the same user.
+    """
+    rng = random.Random(random_seed)
+    vocabulary = _vocabulary(rng)
+    tags_per_card = min(tags_per_card, tags_per_user)
+    password_hash = _password_hash()
+
+    dataset = {"password": PASSWORD, "users": []}
+    user_rows, card_rows, tag_rows, link_rows, bucket_rows_ = [], [], [], [], []
+
+    for u in range(users):
+        user_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        username = f"bench-user-{u}"
+        user_rows.append({"id": user_id, "username": username, "password": password_hash, "is_admin": False})
+
+        tag_ids = [uuid.UUID(int=rng.getrandbits(128)) for _ in range(tags_per_user)]
+        tag_names = [f"tag-{t}" for t in range(tags_per_user)]
+        tag_rows.extend({"id": tag_id, "name": name, "user_id": user_id} for tag_id, name in zip(tag_ids, tag_names))
+
+        card_ids, questions, seen = [], [], set()
+        for c in range(cards_per_user):
+            if questions and rng.random() < duplicate_ratio:
+                question = _reword(rng, rng.choice(questions))
+            else:
+                question = _question(rng, vocabulary)
+            if question in seen:
+                question = f"{question[:-1]} {c}?"
+            questions.append(question)
+            seen.add(question)
+
+            card_id = uuid.UUID(int=rng.getrandbits(128))
+            card_ids.append(card_id)
+            card_rows.append({
+                "id": card_id,
+                "question": question,
+                "answer": f"Answer {c}",
+                "user_id": user_id,
+            })
+            bucket_rows_.extend(bucket_rows(card_id, user_id, question))
+            for tag_id in rng.sample(tag_ids, tags_per_card):
+                link_rows.append({"flashcard_id": card_id, "tag_id": tag_id, "id": uuid.uuid4()})
+
+        dataset["users"].append({
+            "id": user_id,
+            "username": username,
+            "card_ids": [str(card_id) for card_id in card_ids],
+            "tag_ids": [str(tag_id) for tag_id in tag_ids],
+            "tag_names": tag_names,
+        })
+
+    with app.app_context():
+        _insert(UserModel, user_rows)
+        _insert(TagModel, tag_rows)
+        _insert(FlashCardModel, card_rows)
+        _insert(FlashCardsTags, link_rows)
+        _insert(QuestionBucketModel, bucket_rows_)
+        db.session.commit()
+
+        for user in dataset["users"]:
+            user["token"] = create_access_token(identity=user["id"], fresh=True)
+
+    return dataset
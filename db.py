@@ -1,3 +1,44 @@
+import os
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import make_url
+
+db = SQLAlchemy()
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def uses_queue_pool(db_url):
+    """In-memory SQLite is pinned to a single StaticPool connection by Flask-SQLAlchemy; everything else pools."""
+    url = make_url(db_url)
+    return not (url.drivername.startswith("sqlite") and url.database in (None, "", ":memory:"))
+
+
+def engine_options(db_url):
+    """Build SQLALCHEMY_ENGINE_OPTIONS from DB_POOL_* environment variables."""
+    options = {
+        # Check connections before use so a database restart doesn't surface as request errors
+        "pool_pre_ping": _env_flag("DB_POOL_PRE_PING", "true"),
+        # Recycle before server-side idle timeouts (and proxies like pgbouncer) drop the connection
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+    if uses_queue_pool(db_url):
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            # create_engine truncates pool_timeout to whole seconds, so don't pretend fractions work
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        )
+    return options
+
 
-db = SQLAlchemy()
\ No newline at end of file
+def dispose_engines(app, close=False):
+    """
+    Drop the pooled connections of every engine. After a fork pass close=False, which forgets the connections
+    inherited from the gunicorn master instead of closing sockets the master still owns.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
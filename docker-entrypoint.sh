@@ -1,5 +1,11 @@
 #!/bin/sh
 
+# APP_SERVER=asgi runs asgi.py (GET /events and the async reads) next to the WSGI container behind the proxy;
+# the WSGI container runs the migrations
+if [ "$APP_SERVER" = "asgi" ]; then
+    exec uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 80 --workers "${WEB_CONCURRENCY:-2}"
+fi
+
 flask db upgrade
 
-exec gunicorn --bind 0.0.0.0:80 "app:create_app()"
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py "app:create_app()"
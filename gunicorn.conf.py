@@ -0,0 +1,86 @@
+"""
+gunicorn.conf.py
+
+Production server profile, picked up by `gunicorn -c gunicorn.conf.py "app:create_app()"`.
+
+The app is built once in the master (preload_app) and shared copy-on-write by the workers; each worker drops
+the pooled DB connections it inherited right after fork. Workers are threaded (gthread) and recycled after a
+jittered number of requests so slow leaks never take every worker down at once. Every setting can be
+overridden from the environment.
+"""
+import multiprocessing
+import os
+import time
+
+from gunicorn.glogging import Logger
+
+_boot_started = time.perf_counter()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:80")
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Requests mostly wait on the database, so a few threads per core keep the CPU busy without the
+# memory cost of one process per concurrent request.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Graceful recycling
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+class AccessLogger(Logger):
+    """The default access log, minus the access tokens EventSource clients pass as ?jwt= on GET /events."""
+
+    def atoms(self, resp, req, environ, request_time):
+        atoms = super().atoms(resp, req, environ, request_time)
+        from events import redact_token
+
+        return {key: redact_token(value) if isinstance(value, str) else value for key, value in atoms.items()}
+
+
+logger_class = AccessLogger
+
+# GET /events streams in asgi.py have to hear about changes made in these workers; the app is created after
+# this file is read, so it picks the setting up
+os.environ.setdefault("EVENTS_BROKER", "socket")
+# A stream holds one of the worker's threads for minutes. Production sends GET /events to asgi.py
+# (APP_SERVER=asgi), but a deployment without it still gets a few streams per worker; 0 turns the route off.
+os.environ.setdefault("EVENTS_MAX_STREAMS", str(max(threads // 4, 1)))
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and os.environ["EVENTS_BROKER"] == "memory":
+        raise RuntimeError(
+            "EVENTS_BROKER=memory only reaches streams in the same process; "
+            "use 'socket' or 'postgres' with more than one worker."
+        )
+
+
+def when_ready(server):
+    server.log.info("Server ready in %.1f ms (preload_app=%s)", (time.perf_counter() - _boot_started) * 1000,
+                    preload_app)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared between processes
+    if server.cfg.preload_app:
+        from db import dispose_engines
+
+        dispose_engines(worker.app.wsgi())
+
+
+def worker_exit(server, worker):
+    # Close pooled connections and the event broker cleanly when a worker is recycled or shut down
+    from db import dispose_engines
+    from events import close_broker
+
+    close_broker(worker.app.wsgi())
+    dispose_engines(worker.app.wsgi(), close=True)
@@ -0,0 +1,357 @@
+"""
+instrumentation.py
+
+Opt-in per-request instrumentation. When enabled, every request records its SQL query count, total DB time,
+the slowest statement, marshmallow dump time and JWT verification time. The numbers are sent back in a
+Server-Timing header, logged as one JSON line per request and aggregated into per-route latency histograms
+that are served from /metrics in the Prometheus text format.
+
+Connection pool gauges and checkout waits are exported too; the wait is only measured when the engine uses
+TimedQueuePool, which create_app selects when instrumentation is on.
+
+Metrics live in process memory, so with several gunicorn workers each worker reports its own numbers.
+"""
+import hmac
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from flask.logging import default_handler
+from flask_jwt_extended.default_callbacks import (default_decode_key_callback,
+                                                  default_token_verification_callback)
+from flask_smorest import abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from db import db
+
+logger = logging.getLogger("flashcards.instrumentation")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+# Bound parameters of the other DBAPI styles: psycopg2's %(name)s / %s and asyncpg's $1
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class MetricsRegistry:
+    """Tiny thread-safe registry of counters, histograms and gauges rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (type, help)
+        self._buckets = {}
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._gauges = {}  # name -> callable returning {labels: value}
+
+    def counter(self, name, help_text):
+        self._meta.setdefault(name, ("counter", help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta.setdefault(name, ("histogram", help_text))
+        self._buckets.setdefault(name, tuple(buckets))
+
+    def gauge(self, name, help_text, callback):
+        """Register a gauge whose samples are read from `callback` at scrape time."""
+        self._meta.setdefault(name, ("gauge", help_text))
+        self._gauges[name] = callback
+
+    def inc(self, name, value=1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets[name]
+        with self._lock:
+            series = self._histograms.setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, upper in enumerate(buckets):
+                if value <= upper:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(series) for key, series in self._histograms.items()}
+
+        for name, (kind, help_text) in sorted(self._meta.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            elif kind == "histogram":
+                buckets = self._buckets[name]
+                for (metric, labels), series in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for upper, count in zip(buckets, series):
+                        lines.append(f"{name}_bucket{_format_labels(labels, le=upper)} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {series[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {series[-1]}")
+            else:
+                for labels, value in sorted(self._gauges[name]().items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, le=None):
+    pairs = list(labels)
+    if le is not None:
+        pairs.append(("le", le))
+    if not pairs:
+        return ""
+    rendered = ",".join(f'{key}="{_escape_label(value)}"' for key, value in pairs)
+    return "{" + rendered + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    return repr(float(value))
+
+
+# Shared by every app in the process, the same way the JWT blocklist is.
+METRICS = MetricsRegistry()
+METRICS.histogram("http_request_duration_seconds", "Request latency by route.")
+METRICS.counter("db_queries_total", "SQL statements executed by route.")
+METRICS.counter("db_query_seconds_total", "Time spent executing SQL by route.")
+METRICS.counter("db_n_plus_one_warnings_total", "Requests that repeated a statement shape more than the threshold.")
+METRICS.histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection, including connects.")
+METRICS.counter("db_pool_checkout_timeouts_total", "Checkouts that gave up after pool_timeout.")
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long every checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            METRICS.inc("db_pool_checkout_timeouts_total")
+            raise
+        finally:
+            METRICS.observe("db_pool_checkout_wait_seconds", time.perf_counter() - started)
+
+
+class RequestStats:
+    """Numbers collected for a single request, stored on flask.g."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.statement_shapes = Counter()
+        self.dump_time = 0.0
+        self.dump_depth = 0
+        self.jwt_started = None
+        self.jwt_time = 0.0
+
+
+def current_stats():
+    """Return the RequestStats of the current request, or None when instrumentation is off."""
+    if not has_request_context():
+        return None
+    return g.get("_request_stats")
+
+
+def statement_shape(statement):
+    """Reduce a SQL statement to its shape so that repeated lookups with different values compare equal."""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _WHITESPACE.sub(" ", shape).strip()
+    return _IN_LIST.sub("IN (?)", shape)
+
+
+@contextmanager
+def timed_dump():
+    """Time a marshmallow dump. Nested schemas dump through this too, so only the outermost call is counted."""
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+
+    stats.dump_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.dump_depth -= 1
+        if stats.dump_depth == 0:
+            stats.dump_time += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    if stats is None:
+        return
+
+    elapsed = time.perf_counter() - conn.info["query_started"]
+    stats.query_count += 1
+    stats.db_time += elapsed
+    stats.statement_shapes[statement_shape(statement)] += 1
+    if elapsed >= stats.slowest_time:
+        stats.slowest_time = elapsed
+        stats.slowest_statement = statement
+
+
+_listeners_installed = False
+_listeners_lock = threading.Lock()
+
+
+def _install_engine_listeners():
+    # Listen on the Engine class so every engine (and every app built by create_app) is covered once.
+    global _listeners_installed
+    with _listeners_lock:
+        if _listeners_installed:
+            return
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listeners_installed = True
+
+
+def _server_timing(stats, total):
+    entries = [
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.query_count} queries"',
+        f"db-slowest;dur={stats.slowest_time * 1000:.2f}",
+        f"serialize;dur={stats.dump_time * 1000:.2f}",
+        f"jwt;dur={stats.jwt_time * 1000:.2f}",
+        f"total;dur={total * 1000:.2f}",
+    ]
+    return ", ".join(entries)
+
+
+def _pool_gauges(app):
+    """A registry of gauges for this app's own engines; /metrics renders it after the process-wide METRICS."""
+    gauges = MetricsRegistry()
+
+    def read(stat):
+        def samples():
+            with app.app_context():
+                engines = dict(db.engines)
+            values = {}
+            for bind, engine in engines.items():
+                if isinstance(engine.pool, QueuePool):
+                    values[(("bind", bind or "default"),)] = stat(engine.pool)
+            return values
+        return samples
+
+    # QueuePool has no public accessor for max_overflow, so take it from the options the engines were built with
+    max_overflow = max(app.config["SQLALCHEMY_ENGINE_OPTIONS"].get("max_overflow", 10), 0)
+    gauges.gauge("db_pool_size", "Configured pool size.", read(lambda pool: pool.size()))
+    gauges.gauge("db_pool_checked_out", "Connections currently checked out.", read(lambda pool: pool.checkedout()))
+    gauges.gauge("db_pool_overflow", "Connections open beyond pool_size.", read(lambda pool: max(pool.overflow(), 0)))
+    gauges.gauge("db_pool_saturation", "Checked out connections as a fraction of pool_size + max_overflow.",
+                 read(lambda pool: pool.checkedout() / (pool.size() + max_overflow)))
+    gauges.gauge("app_startup_seconds", "Time create_app took to build the app.",
+                 lambda: {(): app.extensions.get("startup_seconds", 0.0)})
+    return gauges
+
+
+def init_instrumentation(app, jwt):
+    """Hook request, SQLAlchemy and JWT events of `app` and expose /metrics."""
+    threshold = app.config["INSTRUMENTATION_N_PLUS_ONE_THRESHOLD"]
+
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        logger.addHandler(default_handler)
+
+    _install_engine_listeners()
+    gauges = _pool_gauges(app)
+
+    @jwt.decode_key_loader
+    def start_jwt_timer(jwt_header, jwt_payload):
+        stats = current_stats()
+        if stats is not None:
+            stats.jwt_started = time.perf_counter()
+        return default_decode_key_callback(jwt_header, jwt_payload)
+
+    # Called once the token is decoded and checked against the blocklist, i.e. the end of verification.
+    @jwt.token_verification_loader
+    def stop_jwt_timer(jwt_header, jwt_payload):
+        stats = current_stats()
+        if stats is not None and stats.jwt_started is not None:
+            stats.jwt_time += time.perf_counter() - stats.jwt_started
+            stats.jwt_started = None
+        return default_token_verification_callback(jwt_header, jwt_payload)
+
+    @app.before_request
+    def start_request_stats():
+        g._request_stats = RequestStats()
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = current_stats()
+        if stats is None:
+            return response
+
+        total = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+
+        response.headers["Server-Timing"] = _server_timing(stats, total)
+
+        METRICS.observe("http_request_duration_seconds", total, method=request.method, route=route)
+        METRICS.inc("db_queries_total", stats.query_count, route=route)
+        METRICS.inc("db_query_seconds_total", stats.db_time, route=route)
+
+        repeated = {shape: count for shape, count in stats.statement_shapes.items() if count > threshold}
+        if repeated:
+            METRICS.inc("db_n_plus_one_warnings_total", route=route)
+            for shape, count in repeated.items():
+                logger.warning("Possible N+1 in %s %s: statement ran %d times: %s",
+                               request.method, route, count, shape)
+
+        logger.info(json.dumps({
+            "event": "request",
+            "method": request.method,
+            "route": route,
+            "status": response.status_code,
+            "duration_ms": round(total * 1000, 2),
+            "db_queries": stats.query_count,
+            "db_time_ms": round(stats.db_time * 1000, 2),
+            "db_slowest_ms": round(stats.slowest_time * 1000, 2),
+            "db_slowest_statement": stats.slowest_statement,
+            "serialize_ms": round(stats.dump_time * 1000, 2),
+            "jwt_ms": round(stats.jwt_time * 1000, 2),
+        }))
+        return response
+
+    def metrics():
+        # Routes, query counts and pool state are for the operators' scraper only; without a token, nobody
+        token = app.config["METRICS_TOKEN"]
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+            abort(401, message="GET /metrics needs the METRICS_TOKEN bearer token.",
+                  headers={"WWW-Authenticate": "Bearer"})
+        return Response(METRICS.render() + gauges.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -0,0 +1,51 @@
+"""Add random keys for study-set sampling
+
+Revision ID: 176cace66be6
+Revises: 7399ecff8561
+Create Date: 2026-10-18 22:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '176cace66be6'
+down_revision = '7399ecff8561'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('flashcards', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('random_key', sa.Float(), nullable=True))
+
+    with op.batch_alter_table('flashcards_tags', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('random_key', sa.Float(), nullable=True))
+
+    # Backfill existing rows with keys uniform in [0, 1). random() already is on PostgreSQL; on SQLite it
+    # returns a signed 64-bit integer, so scale it down.
+    if op.get_bind().dialect.name == 'sqlite':
+        uniform = "(random() / 18446744073709551616.0) + 0.5"
+    else:
+        uniform = "random()"
+    op.execute(f"UPDATE flashcards SET random_key = {uniform}")
+    op.execute(f"UPDATE flashcards_tags SET random_key = {uniform}")
+
+    with op.batch_alter_table('flashcards', schema=None) as batch_op:
+        batch_op.alter_column('random_key', existing_type=sa.Float(), nullable=False)
+        batch_op.create_index('ix_flashcards_user_id_random_key', ['user_id', 'random_key'], unique=False)
+
+    with op.batch_alter_table('flashcards_tags', schema=None) as batch_op:
+        batch_op.alter_column('random_key', existing_type=sa.Float(), nullable=False)
+        batch_op.create_index('ix_flashcards_tags_tag_id_random_key', ['tag_id', 'random_key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('flashcards_tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_flashcards_tags_tag_id_random_key')
+        batch_op.drop_column('random_key')
+
+    with op.batch_alter_table('flashcards', schema=None) as batch_op:
+        batch_op.drop_index('ix_flashcards_user_id_random_key')
+        batch_op.drop_column('random_key')
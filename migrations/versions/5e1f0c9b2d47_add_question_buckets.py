@@ -0,0 +1,38 @@
+"""Add question buckets for near-duplicate detection
+
+Revision ID: 5e1f0c9b2d47
+Revises: 176cace66be6
+Create Date: 2026-10-18 23:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1f0c9b2d47'
+down_revision = '176cace66be6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing cards are indexed afterwards with `flask reindex-duplicates`
+    op.create_table('question_buckets',
+    sa.Column('flashcard_id', sa.UUID(), nullable=False),
+    sa.Column('band', sa.SmallInteger(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.ForeignKeyConstraint(['flashcard_id'], ['flashcards.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('flashcard_id', 'band')
+    )
+    with op.batch_alter_table('question_buckets', schema=None) as batch_op:
+        batch_op.create_index('ix_question_buckets_user_id_bucket', ['user_id', 'bucket'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('question_buckets', schema=None) as batch_op:
+        batch_op.drop_index('ix_question_buckets_user_id_bucket')
+
+    op.drop_table('question_buckets')
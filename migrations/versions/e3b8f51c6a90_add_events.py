@@ -0,0 +1,39 @@
+"""Add change events for the live event stream
+
+Revision ID: e3b8f51c6a90
+Revises: 9c4d7a1e3f28
+Create Date: 2026-10-19 01:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b8f51c6a90'
+down_revision = '9c4d7a1e3f28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('events',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('type', sa.String(length=40), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.create_index('ix_events_user_id_id', ['user_id', 'id'], unique=False)
+        batch_op.create_index('ix_events_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_index('ix_events_created_at')
+        batch_op.drop_index('ix_events_user_id_id')
+
+    op.drop_table('events')
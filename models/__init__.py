@@ -1,4 +1,7 @@
+from models.attachment import AttachmentModel
+from models.event import EventModel
 from models.flashcard import FlashCardModel
 from models.flashcards_tags import FlashCardsTags
+from models.question_bucket import QuestionBucketModel
 from models.tag import TagModel
 from models.user import UserModel
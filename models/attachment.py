@@ -0,0 +1,27 @@
+import uuid
+
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from db import db
+
+
+class AttachmentModel(db.Model):
+    """An image or audio file attached to a flashcard. The bytes live in the blob store under `sha256`."""
+    __tablename__ = "attachments"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    flashcard_id = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("flashcards.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # Content hash; several attachments (on any card) share one stored blob when the bytes are identical
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    filename = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+    flashcard = db.relationship("FlashCardModel", back_populates="attachments")
+
+    def __repr__(self):
+        return f"<Attachment(id={self.id}, sha256={self.sha256[:12]}, flashcard_id={self.flashcard_id})>"
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+
+from db import db
+
+
+class EventModel(db.Model):
+    """A change to a user's cards or tags, kept for a while so event streams can resume with Last-Event-ID."""
+    __tablename__ = "events"
+
+    # INTEGER AUTOINCREMENT on SQLite: ids must never be reused after pruning or Last-Event-ID breaks
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    user_id = db.Column(db.String(36), nullable=False)  # No foreign key: the log outlives deleted users until pruned
+    type = db.Column(db.String(40), nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.Index("ix_events_user_id_id", "user_id", "id"),
+        db.Index("ix_events_created_at", "created_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+    def __repr__(self):
+        return f"<Event(id={self.id}, type={self.type}, user_id={self.user_id})>"
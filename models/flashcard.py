@@ -1,3 +1,4 @@
+import random
 import uuid
 
 from sqlalchemy.dialects.postgresql import UUID
@@ -15,6 +16,8 @@ class FlashCardModel(db.Model):
     user_id = db.Column(db.String, db.ForeignKey("users.id"), nullable=False, index=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
     updated_at = db.Column(db.DateTime(timezone=True), onupdate=func.now())
+    # Position in the user's deck for sampling: offsets into the (user_id, random_key) index instead of ORDER BY random()
+    random_key = db.Column(db.Float, nullable=False, default=random.random)
 
     user = db.relationship(
         "UserModel",
@@ -24,11 +27,30 @@ class FlashCardModel(db.Model):
     tags = db.relationship(
         'TagModel',
         secondary="flashcards_tags",
-        backref=db.backref('flashcards', lazy='dynamic'),
+        # Deleting a tag must not load its cards just to drop the link rows; the cards' own (eagerly loaded)
+        # tags collection and ON DELETE CASCADE take care of them
+        backref=db.backref('flashcards', lazy='select', passive_deletes=True),
         lazy='joined'
     )
+    # Near-duplicate index rows, written by duplicates.index_flashcard. Deletes are bulk statements in the
+    # handlers (plus ON DELETE CASCADE), so the ORM never loads them just to remove them.
+    question_buckets = db.relationship(
+        "QuestionBucketModel",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    # Metadata only; blob bytes are read from the blob store when an attachment is downloaded
+    attachments = db.relationship(
+        "AttachmentModel",
+        back_populates="flashcard",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
-    __table_args__ = (db.UniqueConstraint("question", "user_id", name="uq_question_user"),)
+    __table_args__ = (
+        db.UniqueConstraint("question", "user_id", name="uq_question_user"),
+        db.Index("ix_flashcards_user_id_random_key", "user_id", "random_key"),
+    )
 
     def __repr__(self):
         return f"<FlashCard(id={self.id}, question='{self.question[:20]}', user_id={self.user_id})>"
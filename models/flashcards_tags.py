@@ -1,3 +1,4 @@
+import random
 import uuid
 
 from sqlalchemy.dialects.postgresql import UUID
@@ -14,3 +15,8 @@ class FlashCardsTags(db.Model):
     
     # Optionally, you can add an id field if you still want a unique identifier for each record
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    # Position of the card within the tag, so sampling inside a tag walks an index as well
+    random_key = db.Column(db.Float, nullable=False, default=random.random)
+
+    __table_args__ = (db.Index("ix_flashcards_tags_tag_id_random_key", "tag_id", "random_key"),)
@@ -0,0 +1,16 @@
+from sqlalchemy.dialects.postgresql import UUID
+
+from db import db
+
+
+class QuestionBucketModel(db.Model):
+    """One LSH band bucket of a flashcard question; cards sharing a bucket are near-duplicate candidates."""
+    __tablename__ = "question_buckets"
+
+    flashcard_id = db.Column(UUID(as_uuid=True), db.ForeignKey("flashcards.id", ondelete="CASCADE"), primary_key=True)
+    band = db.Column(db.SmallInteger, primary_key=True)
+    # Hash of the band's MinHash rows, salted with the band number so one column can be searched for all bands
+    bucket = db.Column(db.BigInteger, nullable=False)
+    user_id = db.Column(db.String(36), db.ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (db.Index("ix_question_buckets_user_id_bucket", "user_id", "bucket"),)
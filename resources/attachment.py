@@ -0,0 +1,137 @@
+from flask import current_app, request, send_file
+from flask.views import MethodView
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_smorest import Blueprint, abort
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import lazyload
+
+import attachments
+import events
+from db import db
+from models import AttachmentModel, FlashCardModel
+from schemas import AttachmentSchema, AttachmentUploadQuerySchema
+
+blp = Blueprint("attachments", __name__, description="Operations on flashcard attachments")
+
+# Downloads are served inline from the API's origin, so only formats browsers never run script from: no SVG,
+# which can carry <script>
+ALLOWED_MEDIA_TYPES = frozenset({
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif",
+    "audio/mpeg", "audio/mp4", "audio/aac", "audio/ogg", "audio/opus", "audio/wav", "audio/webm", "audio/flac",
+})
+
+
+def get_own_flashcard(flashcard_id):
+    # Tags are not needed here, so skip their eager join
+    flashcard = (
+        FlashCardModel.query.filter_by(id=flashcard_id, user_id=get_jwt_identity())
+        .options(lazyload(FlashCardModel.tags))
+        .first()
+    )
+    if flashcard is None:
+        abort(404, message="Flashcard not found.")
+    return flashcard
+
+
+def get_own_attachment(attachment_id):
+    attachment = (
+        AttachmentModel.query.join(FlashCardModel)
+        .filter(AttachmentModel.id == attachment_id, FlashCardModel.user_id == get_jwt_identity())
+        .first()
+    )
+    if attachment is None:
+        abort(404, message="Attachment not found.")
+    return attachment
+
+
+@blp.route("/flashcard/<uuid:flashcard_id>/attachment")
+class FlashCardAttachments(MethodView):
+
+    @jwt_required()
+    @blp.response(200, AttachmentSchema(many=True))
+    def get(self, flashcard_id):
+        """Get the attachments of a flashcard"""
+        return get_own_flashcard(flashcard_id).attachments
+
+    @jwt_required()
+    @blp.arguments(AttachmentUploadQuerySchema, location="query")
+    @blp.response(201, AttachmentSchema)
+    def post(self, query, flashcard_id):
+        """Attach an image or audio file; the request body is the raw file and Content-Type its media type"""
+        if request.mimetype not in ALLOWED_MEDIA_TYPES:
+            abort(415, message=f"Attachments must be one of: {', '.join(sorted(ALLOWED_MEDIA_TYPES))}.")
+
+        max_bytes = current_app.config["ATTACHMENT_MAX_BYTES"]
+        if request.content_length is not None and request.content_length > max_bytes:
+            abort(413, message=f"Attachments are limited to {max_bytes} bytes.")
+
+        flashcard = get_own_flashcard(flashcard_id)
+        flashcard_id, user_id = flashcard.id, flashcard.user_id
+        # Don't keep a pooled connection idle in a transaction while a slow client sends the body
+        db.session.commit()
+
+        try:
+            with attachments.get_store().upload(request.stream, max_bytes) as (sha256, size):
+                if size == 0:
+                    abort(400, message="The attachment is empty.")
+
+                attachment = AttachmentModel(
+                    flashcard_id=flashcard_id,
+                    sha256=sha256,
+                    size=size,
+                    content_type=request.mimetype,
+                    filename=query.get("filename"),
+                )
+                try:
+                    db.session.add(attachment)
+                    events.record(user_id, "flashcard.updated", flashcard_id=flashcard_id)
+                    db.session.commit()
+                except IntegrityError:
+                    # The card was deleted while the body was uploading; the blob is left to garbage collection
+                    db.session.rollback()
+                    abort(404, message="Flashcard not found.")
+                except SQLAlchemyError:
+                    db.session.rollback()
+                    abort(500, message="An error occurred while saving the attachment to the database.")
+        except attachments.BlobTooLarge:
+            abort(413, message=f"Attachments are limited to {max_bytes} bytes.")
+        return attachment
+
+
+@blp.route("/attachment/<uuid:attachment_id>")
+class Attachment(MethodView):
+
+    @jwt_required()
+    @blp.response(200)
+    def get(self, attachment_id):
+        """Download an attachment (supports Range, If-None-Match and If-Range)"""
+        attachment = get_own_attachment(attachment_id)
+        store = attachments.get_store()
+        if not store.exists(attachment.sha256):
+            abort(404, message="Attachment content is missing.")
+
+        # send_file hands the open file to the server's wsgi.file_wrapper (sendfile under gunicorn)
+        response = send_file(
+            store.path(attachment.sha256),
+            mimetype=attachment.content_type,
+            download_name=attachment.filename,
+            # Rows stored before the allow-list may hold other types (SVG); never let the browser render those
+            as_attachment=attachment.content_type not in ALLOWED_MEDIA_TYPES,
+            conditional=True,
+            etag=attachment.sha256,
+            max_age=current_app.config["ATTACHMENT_CACHE_MAX_AGE"],
+        )
+        # The content behind an attachment id never changes, but only its owner may read it
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        return response
+
+    @jwt_required()
+    def delete(self, attachment_id):
+        """Remove an attachment from its flashcard"""
+        attachment = get_own_attachment(attachment_id)
+        events.record(get_jwt_identity(), "flashcard.updated", flashcard_id=attachment.flashcard_id)
+        db.session.delete(attachment)
+        db.session.commit()
+        return {"message": "Attachment deleted."}
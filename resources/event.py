@@ -0,0 +1,69 @@
+import math
+
+from flask import Response, current_app, request, stream_with_context
+from flask.views import MethodView
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+from flask_smorest import Blueprint, abort
+
+import events
+from db import db
+from schemas import EventStreamQuerySchema
+
+blp = Blueprint("events", __name__, description="Live change notifications")
+
+
+@blp.route("/events")
+class EventStream(MethodView):
+
+    # EventSource cannot set headers, so browsers pass the access token as ?jwt=...
+    @jwt_required(locations=["headers", "query_string"])
+    @blp.arguments(EventStreamQuerySchema, location="query")
+    def get(self, query):
+        """Stream the current user's card and tag changes as Server-Sent Events"""
+        try:
+            start = events.StreamStart(request.headers.get("Last-Event-ID"), query.get("last_event_id"), get_jwt(),
+                                       current_app.config)
+        except ValueError:
+            abort(400, message="Last-Event-ID must be an event id.")
+
+        # Under gunicorn, asgi.py serves the streams so they never hold the API's threads
+        if current_app.config["EVENTS_MAX_STREAMS"] == 0:
+            abort(404, message="Event streams are served by the ASGI app.")
+
+        # Every stream holds a server thread; refuse new ones before they starve the rest of the API
+        slots = events.stream_slots()
+        if not slots.acquire(blocking=False):
+            retry_after = math.ceil(current_app.config["EVENTS_RETRY_MS"] / 1000)
+            abort(503, message="Too many open event streams, try again later.",
+                  headers={"Retry-After": str(retry_after)})
+
+        subscription = None
+        try:
+            # Subscribe before reading the history so nothing committed in between is missed
+            subscription = events.get_broker().subscribe(get_jwt_identity())
+            last_event_id, reset = start.resume(
+                db.session.execute(start.query(db.session.get_bind().dialect.name)).one()
+            )
+
+            body = events.stream(
+                subscription,
+                last_event_id,
+                duration=start.duration,
+                heartbeat=current_app.config["EVENTS_HEARTBEAT_SECONDS"],
+                reset=reset,
+            )
+            response = Response(
+                stream_with_context(body),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        except BaseException:
+            if subscription is not None:
+                subscription.close()
+            slots.release()
+            raise
+        # The server closes the response when the stream ends or the client goes away, possibly before the body
+        # was ever iterated; closing the subscription again is harmless
+        response.call_on_close(subscription.close)
+        response.call_on_close(slots.release)
+        return response
@@ -1,12 +1,20 @@
+import random
+
+from flask import current_app
 from flask.views import MethodView
 from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from flask_smorest import Blueprint, abort
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
+import attachments
+import duplicates
+import events
 from db import db
-from models import FlashCardModel, TagModel
-from schemas import (FlashCardRequestSchema, FlashCardResponseSchema,
+from models import FlashCardModel, FlashCardsTags, TagModel
+from schemas import (DuplicateClusterSchema, FlashCardRequestSchema,
+                     FlashCardResponseSchema, FlashCardSampleQuerySchema,
                      FlashCardSchema, FlashCardUpdateSchema)
 
 blp = Blueprint("flashcards", __name__, description="Operations on flashcards")
@@ -17,8 +25,35 @@ def check_admin():
     if not jwt.get("is_admin"):
         abort(401, message="Admin privilege required. You do not have permission to delete flashcards.")
 
+def sample_flashcard_ids(user_id, n, tag_id=None):
+    """
+    Pick up to n distinct flashcard ids, each card (or card/tag link) with the same chance: count the
+    candidates, draw n distinct positions and read the random_key at each position of the (user_id,
+    random_key) or (tag_id, random_key) index, then look the picked keys up. The offsets only walk that
+    covering index and nothing is sorted or written, so a sample of 20 from a 50k-card deck takes ~10 ms.
+    """
+    if tag_id is None:
+        id_column, key = FlashCardModel.id, FlashCardModel.random_key
+        where = FlashCardModel.user_id == user_id
+    else:
+        id_column, key = FlashCardsTags.flashcard_id, FlashCardsTags.random_key
+        where = FlashCardsTags.tag_id == tag_id
+
+    total = db.session.execute(select(func.count()).where(where)).scalar()
+    if not total:
+        return []
+    probes = [
+        select(key).where(where).order_by(key).limit(1).offset(position).scalar_subquery()
+        for position in random.sample(range(total), min(n, total))
+    ]
+    # A card deleted between the statements shifts the positions past the end; those probes come back empty
+    keys = [picked for picked in db.session.execute(select(*probes)).one() if picked is not None]
+
+    ids_by_key = dict(db.session.execute(select(key, id_column).where(where, key.in_(keys))).all())
+    return list(dict.fromkeys(ids_by_key[picked] for picked in keys if picked in ids_by_key))
+
 # FlashCard specific routes
-@blp.route("/flashcard/<string:flashcard_id>")
+@blp.route("/flashcard/<uuid:flashcard_id>")
 class FlashCard(MethodView):
     
     @jwt_required()
@@ -39,9 +74,12 @@ class FlashCard(MethodView):
         if flashcard is None:
             abort(404, message="Flashcard not found.")  # Return 404 instead of inserting
 
-        flashcard.question = flashcard_data.get("question", flashcard.question)
+        if flashcard_data.get("question", flashcard.question) != flashcard.question:
+            flashcard.question = flashcard_data["question"]
+            duplicates.index_flashcard(flashcard)
         flashcard.answer = flashcard_data.get("answer", flashcard.answer)
 
+        events.record(flashcard.user_id, "flashcard.updated", flashcard_id=flashcard.id)
         db.session.commit()
         return flashcard
 
@@ -52,11 +90,61 @@ class FlashCard(MethodView):
 
         flashcard = FlashCardModel.query.get_or_404(flashcard_id)
         
+        duplicates.unindex_flashcard(flashcard.id)
+        attachments.detach_flashcard(flashcard.id)
+        events.record(flashcard.user_id, "flashcard.deleted", flashcard_id=flashcard.id)
         db.session.delete(flashcard)
         db.session.commit()
         return {"message": "Flashcard deleted successfully."}
     
 
+@blp.route("/flashcard/random")
+class FlashCardRandom(MethodView):
+
+    @jwt_required()
+    @blp.arguments(FlashCardSampleQuerySchema, location="query")
+    @blp.response(200, FlashCardSchema(many=True))
+    def get(self, query):
+        """Get up to n random flashcards of the current user, optionally only those with a given tag"""
+        user_id = get_jwt_identity()
+
+        tag_id = query.get("tag")
+        if tag_id is not None and TagModel.query.filter_by(id=tag_id, user_id=user_id).first() is None:
+            abort(404, message="Tag not found.")
+
+        flashcard_ids = sample_flashcard_ids(user_id, query["n"], tag_id)
+        if not flashcard_ids:
+            return []
+
+        # selectinload keeps the tag lookup on the flashcards_tags primary key; the nested outer join of
+        # joinedload makes SQLite materialize the whole link table
+        flashcards = (
+            FlashCardModel.query.filter(FlashCardModel.id.in_(flashcard_ids))
+            .options(
+                selectinload(FlashCardModel.tags),
+                selectinload(FlashCardModel.attachments),
+                joinedload(FlashCardModel.user),
+            )
+            .all()
+        )
+        position = {flashcard_id: i for i, flashcard_id in enumerate(flashcard_ids)}
+        return sorted(flashcards, key=lambda flashcard: position[flashcard.id])
+
+
+@blp.route("/flashcard/duplicates")
+class FlashCardDuplicates(MethodView):
+
+    @jwt_required()
+    @blp.response(200, DuplicateClusterSchema(many=True))
+    def get(self):
+        """Get clusters of near-duplicate flashcards of the current user"""
+        user_id = get_jwt_identity()
+        return [
+            {"flashcards": cards, "similarity": round(score, 3)}
+            for cards, score in duplicates.find_clusters(user_id)
+        ]
+
+
 # FlashCard list routes
 @blp.route("/flashcard")
 class FlashCardList(MethodView):
@@ -67,8 +155,16 @@ class FlashCardList(MethodView):
         """Get a list of all flashcards for the currently logged-in user"""
         user_id = get_jwt_identity()
 
-        # Fetch flashcards with tags loaded eagerly
-        flashcards = FlashCardModel.query.filter_by(user_id=user_id).options(joinedload(FlashCardModel.tags)).all()
+        # Fetch flashcards with tags and owner loaded eagerly
+        flashcards = (
+            FlashCardModel.query.filter_by(user_id=user_id)
+            .options(
+                joinedload(FlashCardModel.tags),
+                joinedload(FlashCardModel.user),
+                selectinload(FlashCardModel.attachments),
+            )
+            .all()
+        )
 
         return flashcards
 
@@ -88,11 +184,20 @@ class FlashCardList(MethodView):
         if existing_flashcard:
             abort(400, message="A flashcard with the same question already exists for this user.")
 
+        # Look for reworded versions of the question before the new card is flushed
+        similar = []
+        if current_app.config["DUPLICATE_CHECK_ENABLED"]:
+            similar = duplicates.find_similar(user_id, flashcard_data["question"])
+
         # Extract tags from the request data (if provided)
         tag_names = flashcard_data.pop("tags", [])
 
         # Create the flashcard with the authenticated user's ID
         flashcard = FlashCardModel(user_id=user_id, **flashcard_data)
+        duplicates.index_flashcard(flashcard)
+
+        # Tags created on the way get their own tag.created events
+        new_tags = []
 
         # If no tags provided, assign a default tag
         if not tag_names:
@@ -102,6 +207,7 @@ class FlashCardList(MethodView):
                 # Create the default tag if it doesn’t exist
                 tag = TagModel(name=default_tag_name, user_id=user_id)
                 db.session.add(tag)
+                new_tags.append(tag)
             flashcard.tags.append(tag)
         else:
             # Add tags to the flashcard
@@ -112,10 +218,15 @@ class FlashCardList(MethodView):
                     # Create a new tag if it doesn't exist
                     tag = TagModel(name=tag_name, user_id=user_id)
                     db.session.add(tag)
+                    new_tags.append(tag)
                 flashcard.tags.append(tag)
 
         try:
             db.session.add(flashcard)
+            db.session.flush()  # Assigns the ids for the events
+            for tag in new_tags:
+                events.record(user_id, "tag.created", tag_id=tag.id)
+            events.record(user_id, "flashcard.created", flashcard_id=flashcard.id)
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
@@ -124,4 +235,9 @@ class FlashCardList(MethodView):
             db.session.rollback()
             abort(500, message="An error occurred while saving the flashcard to the database.")
 
+        # The card is still created; clients decide whether to keep it
+        flashcard.duplicates = [
+            {"id": str(flashcard_id), "question": question, "similarity": round(score, 3)}
+            for flashcard_id, question, score in similar
+        ]
         return flashcard
@@ -1,8 +1,10 @@
 from flask.views import MethodView
 from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from flask_smorest import Blueprint, abort
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import selectinload
 
+import events
 from db import db
 from models import FlashCardModel, FlashCardsTags, TagModel
 from schemas import FlashCardAndTagSchema, TagSchema
@@ -18,7 +20,7 @@ def commit_to_db():
         abort(500, message=f"An error occurred while processing your request: {str(e)}")
 
 # Tag-specific routes
-@blp.route("/tag/<string:tag_id>")
+@blp.route("/tag/<uuid:tag_id>")
 class Tag(MethodView):
 
     @jwt_required()
@@ -30,23 +32,22 @@ class Tag(MethodView):
 
     @jwt_required()
     @blp.response(202, description="Deletes a tag if no flashcard is tagged with it.")
-    @blp.response(404, description="Tag not found.")
-    @blp.response(400, description="Tag is associated with one or more flashcards, deletion prevented.")
+    @blp.alt_response(404, description="Tag not found.")
+    @blp.alt_response(400, description="Tag is associated with one or more flashcards, deletion prevented.")
     def delete(self, tag_id):
         """Delete tag if it's not associated with any flashcards"""
         tag = TagModel.query.get_or_404(tag_id)
-        print(f"Tag: {tag}")
-        print(f"Tag flashcards: {tag.flashcards}")  # Debugging: Check the value of flashcards
 
         # Check if flashcards is empty
         if db.session.query(FlashCardsTags).filter_by(tag_id=tag_id).count() == 0:
+            events.record(tag.user_id, "tag.deleted", tag_id=tag.id)
             db.session.delete(tag)
             commit_to_db()
             return {"message": "Tag deleted successfully."}
 
         abort(400, message="Could not delete tag. Make sure tag is not associated with any flashcard.")
 
-@blp.route("/flashcard/<string:flashcard_id>/tag/<string:tag_id>")
+@blp.route("/flashcard/<uuid:flashcard_id>/tag/<uuid:tag_id>")
 class LinkTagsToFlashCards(MethodView):
 
     @jwt_required()
@@ -60,6 +61,7 @@ class LinkTagsToFlashCards(MethodView):
             abort(400, message="Tag is already linked to this flashcard.")
 
         flashcard.tags.append(tag)
+        events.record(flashcard.user_id, "tag.linked", flashcard_id=flashcard.id, tag_id=tag.id)
         commit_to_db()
         return tag
 
@@ -74,10 +76,11 @@ class LinkTagsToFlashCards(MethodView):
             abort(400, message="Tag is not linked to this flashcard.")
 
         flashcard.tags.remove(tag)
+        events.record(flashcard.user_id, "tag.unlinked", flashcard_id=flashcard.id, tag_id=tag.id)
         commit_to_db()
         return {"message": "Flashcard removed from the tag", "flashcard": flashcard, "tag": tag}
 
-@blp.route("/flashcard/<string:flashcard_id>/tag")
+@blp.route("/flashcard/<uuid:flashcard_id>/tag")
 class TagInFlashCard(MethodView):
 
     @jwt_required()
@@ -85,7 +88,14 @@ class TagInFlashCard(MethodView):
     def get(self, flashcard_id):
         """Get all tags associated with a flashcard"""
         flashcard = FlashCardModel.query.get_or_404(flashcard_id)
-        return flashcard.tags
+
+        # Load every tag's flashcards in one query instead of one per tag
+        return (
+            TagModel.query.join(FlashCardsTags, FlashCardsTags.tag_id == TagModel.id)
+            .filter(FlashCardsTags.flashcard_id == flashcard.id)
+            .options(selectinload(TagModel.flashcards))
+            .all()
+        )
 
     @jwt_required()
     @blp.arguments(TagSchema)
@@ -97,16 +107,28 @@ class TagInFlashCard(MethodView):
 
         # Check if the tag already exists
         tag = TagModel.query.filter_by(name=tag_data["name"]).first()
-        if not tag:
-            tag = TagModel(name=tag_data["name"])
+        created = tag is None
+        if created:
+            tag = TagModel(name=tag_data["name"], user_id=flashcard.user_id)
             db.session.add(tag)
 
         # Associate the tag with the flashcard (prevent duplicates)
-        if tag not in flashcard.tags:
-            flashcard.tags.append(tag)
+        if tag in flashcard.tags:
+            abort(400, message="Tag already exists for this flashcard.")
+
+        flashcard.tags.append(tag)
+        try:
+            db.session.flush()  # Assigns the id of a new tag for the events
+            if created:
+                events.record(flashcard.user_id, "tag.created", tag_id=tag.id)
+            events.record(flashcard.user_id, "tag.linked", flashcard_id=flashcard.id, tag_id=tag.id)
             db.session.commit()
-        else:
+        except IntegrityError:
+            db.session.rollback()
             abort(400, message="Tag already exists for this flashcard.")
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while saving the tag to the database.")
 
         return tag
 
@@ -119,7 +141,7 @@ class TagList(MethodView):
     def get(self):
         """Get a list of all tags"""
         user_id = get_jwt_identity()  # Get the current user ID from the JWT token
-        return TagModel.query.filter_by(user_id=user_id).all()
+        return TagModel.query.filter_by(user_id=user_id).options(selectinload(TagModel.flashcards)).all()
 
     @jwt_required()
     @blp.arguments(TagSchema)
@@ -132,6 +154,16 @@ class TagList(MethodView):
         if TagModel.query.filter_by(name=tag_data["name"], user_id=user_id).first():
             abort(400, message="A tag with this name already exists for this user.")
 
-        db.session.add(tag)
-        commit_to_db()
+        try:
+            db.session.add(tag)
+            db.session.flush()  # Assigns the id for the event
+            events.record(user_id, "tag.created", tag_id=tag.id)
+            db.session.commit()
+        except IntegrityError:
+            # Created by a concurrent request since the check above
+            db.session.rollback()
+            abort(400, message="A tag with this name already exists for this user.")
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(500, message="An error occurred while saving the tag to the database.")
         return tag
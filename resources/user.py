@@ -4,6 +4,8 @@ from flask_jwt_extended import (create_access_token, create_refresh_token,
                                 get_jwt, get_jwt_identity, jwt_required)
 from flask_smorest import Blueprint, abort
 
+import attachments
+import duplicates
 from blocklist import BLOCKLIST
 from db import db
 from models import UserModel
@@ -97,6 +99,8 @@ class User(MethodView):
             abort(403, message="You can only delete your own account.")
         
         user = UserModel.query.get_or_404(user_id)
+        duplicates.unindex_user(user.id)
+        attachments.detach_user(user.id)
         db.session.delete(user)
         db.session.commit()
         return {"message": "User deleted."}, 200
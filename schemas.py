@@ -1,21 +1,40 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate
 
+from instrumentation import timed_dump
 
-class PlainFlashCardSchema(Schema):
+
+class BaseSchema(Schema):
+    # Lets the optional request instrumentation measure serialization time.
+    def dump(self, obj, *, many=None):
+        with timed_dump():
+            return super().dump(obj, many=many)
+
+
+class PlainFlashCardSchema(BaseSchema):
     id = fields.Str(dump_only=True)
     question = fields.Str(required=True)
     answer = fields.Str(required=True)
 
-class PlainTagSchema(Schema):
+class PlainTagSchema(BaseSchema):
     id = fields.Str(dump_only=True)
     name = fields.Str(required=True)
 
-class PlainUserSchema(Schema):
+class AttachmentSchema(BaseSchema):
+    id = fields.Str(dump_only=True)
+    filename = fields.Str(dump_only=True)
+    content_type = fields.Str(dump_only=True)
+    size = fields.Int(dump_only=True)
+    sha256 = fields.Str(dump_only=True)
+
+class AttachmentUploadQuerySchema(BaseSchema):
+    filename = fields.Str(validate=validate.Length(max=255))
+
+class PlainUserSchema(BaseSchema):
     id = fields.Str(dump_only=True)
     username = fields.Str(required=True)
     password = fields.Str(required=True, load_only=True)
 
-class FlashCardUpdateSchema(Schema):
+class FlashCardUpdateSchema(BaseSchema):
     question = fields.Str()
     answer = fields.Str()
     user_id = fields.Str()
@@ -25,21 +44,40 @@ class FlashCardRequestSchema(PlainFlashCardSchema):
     user = fields.Nested(PlainUserSchema(), dump_only=True)   # Include user details
     tags = fields.List(fields.Str(), required=False)  # Tags as strings for input
 
+class DuplicateSchema(BaseSchema):
+    id = fields.Str(dump_only=True)
+    question = fields.Str(dump_only=True)
+    similarity = fields.Float(dump_only=True)
+
+class DuplicateClusterSchema(BaseSchema):
+    similarity = fields.Float(dump_only=True)  # Highest similarity between two cards of the cluster
+    flashcards = fields.List(fields.Nested(PlainFlashCardSchema()), dump_only=True)
+
 # Response schema (for output)
 class FlashCardResponseSchema(PlainFlashCardSchema):
     user = fields.Nested(PlainUserSchema(), dump_only=True)   # User details in response
     tags = fields.List(fields.Nested(PlainTagSchema()), dump_only=True)  # Tags as objects in response
+    duplicates = fields.List(fields.Nested(DuplicateSchema()), dump_only=True)  # Likely near-duplicates
+    attachments = fields.List(fields.Nested(AttachmentSchema()), dump_only=True)
 
 class FlashCardSchema(PlainFlashCardSchema):
     user = fields.Nested(PlainUserSchema(), dump_only=True)   # Include user details
     tags = fields.List(fields.Str(), required=False, load_only=True)  # Allow tags in request
     tags = fields.List(fields.Nested(PlainTagSchema()), dump_only=True)  # Directly use 'tags'
+    attachments = fields.List(fields.Nested(AttachmentSchema()), dump_only=True)  # Metadata, never the bytes
+
+class FlashCardSampleQuerySchema(BaseSchema):
+    n = fields.Int(load_default=20, validate=validate.Range(min=1, max=100))
+    tag = fields.UUID()  # Only sample cards linked to this tag
+
+class EventStreamQuerySchema(BaseSchema):
+    last_event_id = fields.Int()  # For clients that cannot send the Last-Event-ID header
 
 class TagSchema(PlainTagSchema):
     flashcards = fields.List(fields.Nested(PlainFlashCardSchema()), dump_only=True)
     users = fields.List(fields.Nested(PlainUserSchema(), many=True, load_only=True))
 
-class FlashCardAndTagSchema(Schema):
+class FlashCardAndTagSchema(BaseSchema):
     message = fields.Str()
     flashcard = fields.Nested(FlashCardSchema)
     tag = fields.Nested(TagSchema)
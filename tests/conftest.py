@@ -0,0 +1,116 @@
+"""
+Shared fixtures: an app on in-memory SQLite, seeded datasets of several sizes and the query-count guardrail.
+
+Mark a test with `@pytest.mark.max_queries(n)` to fail it when any request it makes through the test client
+runs more than `n` SQL statements. Statements executed outside a request (seeding, assertions in the test
+body) are not counted.
+
+Mark a test (or module) with `@pytest.mark.instrument` to build the app with `create_app(instrument=True)`.
+"""
+from datetime import timedelta
+
+import pytest
+from flask import has_request_context, request, request_started
+from sqlalchemy import event
+
+from app import create_app
+from benchmarks.seed import seed
+from db import db
+
+# name -> seed() arguments. The same bound has to hold for all of them, so a handler that
+# runs one query per card or tag fails on the larger datasets.
+DATASET_SIZES = {
+    "small": dict(users=1, cards_per_user=2, tags_per_user=2, tags_per_card=1),
+    "medium": dict(users=2, cards_per_user=20, tags_per_user=5, tags_per_card=2, duplicate_ratio=0.1),
+    "large": dict(users=3, cards_per_user=80, tags_per_user=12, tags_per_card=4, duplicate_ratio=0.2),
+}
+
+
+class QueryCounter:
+    """Count SQL statements per request made against `app`."""
+
+    def __init__(self, app):
+        self.app = app
+        self.requests = []  # [(method path, statements), ...] in the order the requests were made
+
+    def __enter__(self):
+        with self.app.app_context():
+            self.engine = db.engine
+        event.listen(self.engine, "after_cursor_execute", self._on_execute)
+        request_started.connect(self._on_request, self.app)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "after_cursor_execute", self._on_execute)
+        request_started.disconnect(self._on_request, self.app)
+
+    def _on_request(self, sender, **extra):
+        self.requests.append([f"{request.method} {request.path}", []])
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and self.requests:
+            self.requests[-1][1].append(statement)
+
+
+@pytest.fixture
+def app(request, tmp_path):
+    instrument = True if request.node.get_closest_marker("instrument") else None
+    app = create_app("sqlite://", instrument=instrument)
+    app.config["TESTING"] = True
+    app.config["ATTACHMENT_DIR"] = str(tmp_path / "attachments")
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(params=list(DATASET_SIZES))
+def dataset(request, app):
+    """Seeded data, once per size in DATASET_SIZES."""
+    return seed(app, **DATASET_SIZES[request.param])
+
+
+@pytest.fixture
+def user(dataset):
+    return dataset["users"][0]
+
+
+@pytest.fixture
+def auth(user):
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+@pytest.fixture
+def query_counter(app):
+    with QueryCounter(app) as counter:
+        yield counter
+
+
+@pytest.fixture(autouse=True)
+def _enforce_max_queries(request):
+    marker = request.node.get_closest_marker("max_queries")
+    if marker is None:
+        yield
+        return
+
+    limit = marker.args[0]
+    counter = request.getfixturevalue("query_counter")
+    yield
+    assert counter.requests, "max_queries is set but the test made no requests"
+    for name, statements in counter.requests:
+        assert len(statements) <= limit, (
+            f"{name} ran {len(statements)} SQL statements, expected at most {limit}:\n" + "\n".join(statements)
+        )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "max_queries(n): fail if any request in the test runs more than n statements")
+    config.addinivalue_line("markers", "instrument: build the app with request instrumentation enabled")
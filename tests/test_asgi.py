@@ -0,0 +1,190 @@
+"""
+The async read path must answer exactly like the Flask routes it mirrors, and GET /events streams changes
+made through the Flask app.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from app import create_app  # noqa: E402
+from asgi import create_asgi_app  # noqa: E402
+from db import db  # noqa: E402
+import events  # noqa: E402
+
+
+def _messages(asgi_app, path, token=None, method="GET"):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": headers}
+    asyncio.run(asgi_app(scope, receive, send))
+    return messages
+
+
+def _call(asgi_app, path, token=None, method="GET"):
+    messages = _messages(asgi_app, path, token, method)
+    return messages[0]["status"], json.loads(messages[1]["body"])
+
+
+@pytest.fixture
+def app(tmp_path):
+    # In-memory SQLite is private to one engine, so the sync and async engines share a file instead
+    app = create_app(f"sqlite:///{tmp_path / 'asgi.db'}")
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.mark.parametrize("path", ["/flashcard", "/tag", "/flashcard/{card_id}/tag"])
+def test_matches_sync_app(client, dataset, user, auth, path):
+    asgi_app = create_asgi_app(flask_app=client.application)
+    path = path.format(card_id=user["card_ids"][0])
+
+    status, body = _call(asgi_app, path, user["token"])
+    expected = client.get(path, headers=auth)
+
+    assert status == expected.status_code == 200
+    assert sorted(body, key=lambda item: item["id"]) == sorted(expected.json, key=lambda item: item["id"])
+
+
+@pytest.mark.parametrize("token, error", [(None, "authorization_required"), ("garbage", "invalid_token")])
+def test_rejects_like_sync_app(client, dataset, token, error):
+    status, body = _call(create_asgi_app(flask_app=client.application), "/flashcard", token)
+    assert status == 401
+    assert body["error"] == error
+
+
+def test_head_sends_headers_only(client, dataset, user):
+    asgi_app = create_asgi_app(flask_app=client.application)
+    get = _messages(asgi_app, "/tag", user["token"])
+    head = _messages(asgi_app, "/tag", user["token"], method="HEAD")
+
+    assert head[0] == get[0]  # Same status and Content-Length
+    assert head[1]["body"] == b""
+    assert len(head) == 2
+
+
+def test_unknown_flashcard(client, dataset, user):
+    status, _ = _call(create_asgi_app(flask_app=client.application), "/flashcard/not-a-uuid/tag", user["token"])
+    assert status == 404
+
+
+def _stream(asgi_app, token, headers=(), query=b"", during=None, disconnect_after=None):
+    """
+    Open GET /events, run the blocking `during()` in a thread while it is open and return (status, SSE frames).
+    With `disconnect_after`, the client goes away after that many seconds.
+    """
+    headers = [(b"authorization", f"Bearer {token}".encode()), *headers] if token else list(headers)
+    messages = []
+
+    async def run():
+        gone = asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/events", "headers": headers, "query_string": query}
+        stream = asyncio.ensure_future(asgi_app(scope, receive, send))
+        await asyncio.sleep(0.05)  # Let the stream subscribe first
+        if during is not None:
+            await asyncio.to_thread(during)
+        if disconnect_after is not None:
+            await asyncio.sleep(disconnect_after)
+            gone.set()
+        await stream
+
+    asyncio.run(run())
+    if messages[0]["status"] != 200:
+        return messages[0]["status"], []
+    body = b"".join(message.get("body", b"") for message in messages[1:]).decode()
+    frames = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            frames.append({"id": int(fields["id"]), "event": fields["event"], "data": json.loads(fields["data"])})
+    return messages[0]["status"], frames
+
+
+@pytest.fixture
+def short_streams(app):
+    app.config["EVENTS_MAX_STREAM_SECONDS"] = 0.5
+    app.config["EVENTS_HEARTBEAT_SECONDS"] = 0.1
+
+
+def test_event_stream_delivers_flask_changes(client, dataset, user, auth, short_streams):
+    asgi_app = create_asgi_app(flask_app=client.application)
+    created = []
+
+    def change():
+        created.append(client.post("/flashcard", json={"question": "Streamed?", "answer": "Yes"}, headers=auth).json)
+        client.delete(f"/flashcard/{created[0]['id']}", headers=auth)
+
+    status, frames = _stream(asgi_app, user["token"], during=change)
+
+    assert status == 200
+    assert [frame["event"] for frame in frames] == ["tag.created", "flashcard.created", "flashcard.deleted"]
+    assert frames[-1]["data"] == {"flashcard_id": created[0]["id"]}
+
+
+def test_event_stream_resumes_and_resets(app, client, dataset, user, auth, short_streams):
+    asgi_app = create_asgi_app(flask_app=client.application)
+    client.post("/flashcard", json={"question": "Missed?", "answer": "Yes"}, headers=auth)
+
+    _, history = _stream(asgi_app, None, query=f"jwt={user['token']}&last_event_id=0".encode())
+    assert [frame["event"] for frame in history] == ["tag.created", "flashcard.created"]
+
+    with app.app_context():
+        events.prune(older_than_seconds=-1)
+    _, frames = _stream(asgi_app, user["token"], headers=[(b"last-event-id", b"0")])
+    assert [frame["event"] for frame in frames] == ["reset"]
+
+
+def test_event_stream_rejects_like_sync_app(client, dataset, user):
+    asgi_app = create_asgi_app(flask_app=client.application)
+    assert _stream(asgi_app, None)[0] == 401
+    assert _stream(asgi_app, user["token"], headers=[(b"last-event-id", b"abc")])[0] == 400
+
+
+def test_event_stream_ends_when_the_client_leaves(client, dataset, user):
+    asgi_app = create_asgi_app(flask_app=client.application)
+    with client.application.app_context():
+        broker = events.get_broker()
+
+    started = time.monotonic()
+    status, _ = _stream(asgi_app, user["token"], disconnect_after=0.1)
+
+    assert status == 200
+    assert time.monotonic() - started < 5  # EVENTS_MAX_STREAM_SECONDS is 300
+    assert not broker._subscriptions
+
+
+def test_flask_route_leaves_streams_to_asgi(app, client, dataset, auth):
+    app.config["EVENTS_MAX_STREAMS"] = 0
+    assert client.get("/events", headers=auth).status_code == 404
+
+
+def test_access_log_redacts_tokens(client):
+    create_asgi_app(flask_app=client.application)
+    record = logging.LogRecord("uvicorn.access", logging.INFO, __file__, 0, '%s - "%s %s HTTP/%s" %d',
+                               ("127.0.0.1:5000", "GET", "/events?jwt=secret.token&last_event_id=4", "1.1", 200), None)
+
+    assert logging.getLogger("uvicorn.access").filter(record)
+    assert record.getMessage() == '127.0.0.1:5000 - "GET /events?jwt=[redacted]&last_event_id=4 HTTP/1.1" 200'
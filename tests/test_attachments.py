@@ -0,0 +1,236 @@
+"""
+Attachments: uploads land in the content-addressed store once per distinct file, card reads carry only the
+metadata and downloads honour ETag and Range.
+"""
+import hashlib
+import io
+import os
+import threading
+import uuid
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+import attachments
+from db import db
+from models import AttachmentModel
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 64
+
+
+def _upload(client, card_id, auth, data=PNG, content_type="image/png", filename="diagram.png"):
+    return client.post(
+        f"/flashcard/{card_id}/attachment?filename={filename}",
+        data=data,
+        headers={**auth, "Content-Type": content_type},
+    )
+
+
+def _blob_files(app):
+    with app.app_context():
+        return [sha256 for sha256, _ in attachments.get_store().stored()]
+
+
+def test_upload_is_content_addressed(app, client, user, auth):
+    response = _upload(client, user["card_ids"][0], auth)
+
+    assert response.status_code == 201
+    assert response.json["sha256"] == hashlib.sha256(PNG).hexdigest()
+    assert response.json["size"] == len(PNG)
+    assert response.json["content_type"] == "image/png"
+    with app.app_context():
+        with open(attachments.get_store().path(response.json["sha256"]), "rb") as blob:
+            assert blob.read() == PNG
+
+
+def test_identical_uploads_share_one_blob(app, client, user, auth):
+    first = _upload(client, user["card_ids"][0], auth).json
+    second = _upload(client, user["card_ids"][-1], auth, filename="copy.png").json
+
+    assert first["id"] != second["id"]
+    assert first["sha256"] == second["sha256"]
+    assert _blob_files(app) == [first["sha256"]]
+
+
+def test_card_reads_include_attachment_metadata(client, user, auth):
+    card_id = user["card_ids"][0]
+    attachment = _upload(client, card_id, auth).json
+
+    card = client.get(f"/flashcard/{card_id}", headers=auth).json
+    listed = next(card for card in client.get("/flashcard", headers=auth).json if card["id"] == card_id)
+
+    assert card["attachments"] == listed["attachments"] == [attachment]
+
+
+def test_download_supports_etag_and_range(client, user, auth):
+    attachment = _upload(client, user["card_ids"][0], auth).json
+    url = f"/attachment/{attachment['id']}"
+
+    response = client.get(url, headers=auth)
+    assert response.status_code == 200
+    assert response.data == PNG
+    assert response.mimetype == "image/png"
+    assert response.headers["ETag"] == f'"{attachment["sha256"]}"'
+    assert "private" in response.headers["Cache-Control"]
+
+    not_modified = client.get(url, headers={**auth, "If-None-Match": response.headers["ETag"]})
+    assert not_modified.status_code == 304
+
+    partial = client.get(url, headers={**auth, "Range": "bytes=8-15"})
+    assert partial.status_code == 206
+    assert partial.data == PNG[8:16]
+    assert partial.headers["Content-Range"] == f"bytes 8-15/{len(PNG)}"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert "attachment" not in response.headers.get("Content-Disposition", "")
+
+
+@pytest.mark.parametrize("content_type", ["application/octet-stream", "image/svg+xml", "text/html"])
+def test_rejects_other_media_types(client, user, auth, content_type):
+    response = _upload(client, user["card_ids"][0], auth, data=b"<svg onload=alert(1)/>", content_type=content_type)
+    assert response.status_code == 415
+
+
+def test_older_svg_attachments_are_downloaded_not_rendered(app, client, user, auth):
+    attachment = _upload(client, user["card_ids"][0], auth, filename="drawing.svg").json
+    with app.app_context():
+        db.session.get(AttachmentModel, uuid.UUID(attachment["id"])).content_type = "image/svg+xml"
+        db.session.commit()
+
+    response = client.get(f"/attachment/{attachment['id']}", headers=auth)
+
+    assert response.status_code == 200
+    assert response.headers["Content-Disposition"].startswith("attachment")
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+
+def test_upload_to_card_deleted_meanwhile(client, user, auth):
+    # Another request deletes the card while the body uploads; in-memory SQLite doesn't enforce the foreign key,
+    # so fail the insert the way Postgres would
+    @event.listens_for(db.session, "before_flush", once=True)
+    def card_gone(session, flush_context, instances):
+        raise IntegrityError("INSERT INTO attachments ...", {}, Exception("FOREIGN KEY constraint failed"))
+
+    response = _upload(client, user["card_ids"][0], auth)
+
+    assert response.status_code == 404
+    assert response.json["message"] == "Flashcard not found."
+
+
+def test_rejects_large_uploads(app, client, user, auth):
+    app.config["ATTACHMENT_MAX_BYTES"] = 1024
+
+    response = _upload(client, user["card_ids"][0], auth)
+
+    assert response.status_code == 413
+    assert _blob_files(app) == []
+
+
+def test_other_users_cannot_read_attachments(app, client, user, auth):
+    attachment = _upload(client, user["card_ids"][0], auth).json
+    client.post("/register", json={"username": "other", "password": "secret"})
+    token = client.post("/login", json={"username": "other", "password": "secret"}).json["access_token"]
+    other = {"Authorization": f"Bearer {token}"}
+
+    assert client.get(f"/attachment/{attachment['id']}", headers=other).status_code == 404
+    assert _upload(client, user["card_ids"][0], other).status_code == 404
+
+
+def test_unknown_attachment(client, dataset, auth):
+    assert client.get(f"/attachment/{uuid.uuid4()}", headers=auth).status_code == 404
+
+
+def test_garbage_collection_keeps_referenced_blobs(app, client, user, auth):
+    first = _upload(client, user["card_ids"][0], auth).json
+    _upload(client, user["card_ids"][-1], auth)
+
+    client.delete(f"/attachment/{first['id']}", headers=auth)
+    with app.app_context():
+        assert attachments.collect_garbage(grace_seconds=0) == 0
+    assert _blob_files(app) == [first["sha256"]]
+
+
+def test_garbage_collection_after_card_delete(app, client, user, auth):
+    card_id = user["card_ids"][0]
+    _upload(client, card_id, auth)
+
+    client.delete(f"/flashcard/{card_id}", headers=auth)
+
+    with app.app_context():
+        assert AttachmentModel.query.count() == 0
+        assert attachments.collect_garbage(grace_seconds=3600) == 0  # Still within the grace period
+        assert attachments.collect_garbage(grace_seconds=0) == 1
+    assert _blob_files(app) == []
+    assert not os.listdir(os.path.join(app.config["ATTACHMENT_DIR"], "tmp"))
+
+
+@pytest.mark.parametrize("mtime_refreshed", [True, False])
+def test_garbage_collection_spares_blobs_relinked_during_the_scan(app, client, user, auth, monkeypatch,
+                                                                  mtime_refreshed):
+    first = _upload(client, user["card_ids"][0], auth).json
+    client.delete(f"/attachment/{first['id']}", headers=auth)
+    path = os.path.join(app.config["ATTACHMENT_DIR"], first["sha256"][:2], first["sha256"][2:4], first["sha256"])
+    os.utime(path, (0, 0))
+
+    scan = attachments.BlobStore.stored
+
+    def stored_then_reupload(store):
+        blobs = list(scan(store))
+        # The same bytes are uploaded again after the scan read the old mtime and references
+        assert _upload(client, user["card_ids"][-1], auth).status_code == 201
+        if not mtime_refreshed:
+            os.utime(path, (0, 0))  # Only the new row keeps the blob alive
+        return blobs
+
+    monkeypatch.setattr(attachments.BlobStore, "stored", stored_then_reupload)
+    with app.app_context():
+        assert attachments.collect_garbage(grace_seconds=60) == 0
+    monkeypatch.undo()
+    assert _blob_files(app) == [first["sha256"]]
+
+
+def test_garbage_collection_spares_slow_uploads(app):
+    with app.app_context():
+        store = attachments.get_store()
+    # One upload is still being received, another died halfway; both temporary files are past the grace period
+    tmp, tmp_path, sha256, _ = store._receive(io.BytesIO(PNG), len(PNG))
+    abandoned = os.path.join(store.root, "tmp", "abandoned")
+    open(abandoned, "wb").close()
+    for path in (tmp_path, abandoned):
+        os.utime(path, (0, 0))
+
+    with app.app_context():
+        attachments.collect_garbage(grace_seconds=60)
+
+    assert os.listdir(os.path.join(store.root, "tmp")) == [os.path.basename(tmp_path)]
+    store._link(tmp, tmp_path, sha256)
+    assert store.exists(sha256)
+
+
+def test_uploads_wait_for_garbage_collection_to_release_the_store(app, client, user, auth):
+    with app.app_context():
+        store = attachments.get_store()
+    results = []
+    with store.lock(exclusive=True):
+        upload = threading.Thread(target=lambda: results.append(_upload(client, user["card_ids"][0], auth)))
+        upload.start()
+        upload.join(timeout=0.5)
+        assert upload.is_alive()  # Linking the blob waits until the collector is done
+        assert _blob_files(app) == []
+    upload.join(timeout=10)
+
+    assert results[0].status_code == 201
+    assert _blob_files(app) == [results[0].json["sha256"]]
+
+
+def test_upload_body_is_read_outside_a_transaction(app, client, user, auth, monkeypatch):
+    receive = attachments.BlobStore._receive
+    in_transaction = []
+
+    def receive_and_check(store, stream, max_bytes):
+        in_transaction.append(db.session().in_transaction())
+        return receive(store, stream, max_bytes)
+
+    monkeypatch.setattr(attachments.BlobStore, "_receive", receive_and_check)
+    assert _upload(client, user["card_ids"][0], auth).status_code == 201
+    assert in_transaction == [False]
@@ -0,0 +1,130 @@
+"""
+Connection pool settings from DB_POOL_* variables and the pool metrics served from /metrics.
+"""
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app import create_app
+from db import db, dispose_engines, engine_options
+from instrumentation import METRICS, TimedQueuePool
+
+METRICS_AUTH = {"Authorization": "Bearer scraper-secret"}
+
+
+def _sample(metrics, line_start):
+    for line in metrics.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+@pytest.fixture
+def pool_env(monkeypatch):
+    for name, value in {"DB_POOL_SIZE": "2", "DB_MAX_OVERFLOW": "1", "DB_POOL_TIMEOUT": "1",
+                        "DB_POOL_RECYCLE": "60", "DB_POOL_PRE_PING": "false"}.items():
+        monkeypatch.setenv(name, value)
+
+
+@pytest.fixture
+def pool_app(pool_env, tmp_path):
+    app = create_app(f"sqlite:///{tmp_path / 'pool.db'}", instrument=True)
+    app.config["TESTING"] = True
+    app.config["METRICS_TOKEN"] = "scraper-secret"
+    yield app
+    dispose_engines(app, close=True)
+
+
+def test_engine_options_defaults(monkeypatch):
+    for name in ("DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_POOL_TIMEOUT", "DB_POOL_RECYCLE", "DB_POOL_PRE_PING"):
+        monkeypatch.delenv(name, raising=False)
+
+    assert engine_options("sqlite:///data.db") == {
+        "pool_pre_ping": True, "pool_recycle": 1800, "pool_size": 5, "max_overflow": 10, "pool_timeout": 30,
+    }
+
+
+def test_engine_options_from_environment(pool_env):
+    assert engine_options("postgresql://localhost/flashcards") == {
+        "pool_pre_ping": False, "pool_recycle": 60, "pool_size": 2, "max_overflow": 1, "pool_timeout": 1,
+    }
+
+
+@pytest.mark.parametrize("db_url", ["sqlite://", "sqlite:///:memory:"])
+def test_in_memory_sqlite_has_no_queue_pool_options(pool_env, db_url):
+    # Flask-SQLAlchemy pins in-memory SQLite to one StaticPool connection, which rejects these options
+    assert engine_options(db_url) == {"pool_pre_ping": False, "pool_recycle": 60}
+
+
+def test_pool_gauges_and_checkout_wait_on_metrics(pool_app):
+    client = pool_app.test_client()
+    before = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+
+    with pool_app.app_context():
+        engine = db.engine
+    assert isinstance(engine.pool, TimedQueuePool)
+
+    connections = [engine.connect() for _ in range(2)]
+    try:
+        metrics = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+    finally:
+        for connection in connections:
+            connection.close()
+
+    assert _sample(metrics, 'db_pool_size{bind="default"}') == 2
+    assert _sample(metrics, 'db_pool_checked_out{bind="default"}') == 2
+    assert _sample(metrics, 'db_pool_overflow{bind="default"}') == 0
+    assert _sample(metrics, 'db_pool_saturation{bind="default"}') == pytest.approx(2 / 3)
+    waits = "db_pool_checkout_wait_seconds_count"
+    assert _sample(metrics, waits) - _sample(before, waits) == 2
+
+    after = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+    assert _sample(after, 'db_pool_checked_out{bind="default"}') == 0
+    assert _sample(after, 'db_pool_saturation{bind="default"}') == 0
+
+
+def test_pool_checkout_timeouts_on_metrics(pool_app):
+    client = pool_app.test_client()
+    before = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+
+    with pool_app.app_context():
+        engine = db.engine
+    # pool_size + max_overflow connections, then one more that waits DB_POOL_TIMEOUT and gives up
+    connections = [engine.connect() for _ in range(3)]
+    try:
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        metrics = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+    finally:
+        for connection in connections:
+            connection.close()
+
+    assert _sample(metrics, 'db_pool_overflow{bind="default"}') == 1
+    assert _sample(metrics, 'db_pool_saturation{bind="default"}') == 1
+    timeouts = "db_pool_checkout_timeouts_total"
+    assert _sample(metrics, timeouts) - _sample(before, timeouts) == 1
+    # The timed-out checkout waited the full DB_POOL_TIMEOUT, so it is the one wait above 0.5 s
+    fast = 'db_pool_checkout_wait_seconds_bucket{le="0.5"}'
+    waits = "db_pool_checkout_wait_seconds_count"
+    assert (_sample(metrics, waits) - _sample(before, waits)) - (_sample(metrics, fast) - _sample(before, fast)) == 1
+
+
+def test_each_app_reports_its_own_pools(pool_app, monkeypatch, tmp_path):
+    monkeypatch.setenv("DB_POOL_SIZE", "4")
+    other = create_app(f"sqlite:///{tmp_path / 'other.db'}", instrument=True)
+    other.config["METRICS_TOKEN"] = "scraper-secret"
+    try:
+        with pool_app.app_context():
+            connection = db.engine.connect()
+        try:
+            first = pool_app.test_client().get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+            second = other.test_client().get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+        finally:
+            connection.close()
+    finally:
+        dispose_engines(other, close=True)
+
+    assert _sample(first, 'db_pool_size{bind="default"}') == 2
+    assert _sample(first, 'db_pool_checked_out{bind="default"}') == 1
+    assert _sample(second, 'db_pool_size{bind="default"}') == 4
+    assert _sample(second, 'db_pool_checked_out{bind="default"}') == 0
+    assert "db_pool_size" not in METRICS.render()  # Nothing app-specific in the process-wide registry
@@ -0,0 +1,149 @@
+"""
+Near-duplicate detection: reworded questions are reported on create, grouped by GET /flashcard/duplicates
+and the bucket index follows updates and deletes.
+"""
+import uuid
+
+import duplicates
+from db import db
+from models import QuestionBucketModel
+
+
+def _buckets_of(app, card_id):
+    with app.app_context():
+        return QuestionBucketModel.query.filter_by(flashcard_id=uuid.UUID(card_id)).count()
+
+
+def _create(client, auth, question):
+    return client.post("/flashcard", json={"question": question, "answer": "42"}, headers=auth)
+
+
+def test_normalize_ignores_case_punctuation_filler_and_order():
+    assert duplicates.normalize("What is the Capital of France?") == duplicates.normalize("france, capital")
+    assert duplicates.normalize("Café") == duplicates.normalize("cafe")
+
+
+def test_filler_only_questions_match_nothing(app, client, dataset, auth):
+    assert duplicates.shingles("What is it?") == set()
+    first = _create(client, auth, "What is it?").json
+    assert _buckets_of(app, first["id"]) == 0
+
+    assert _create(client, auth, "Why is it?").json["duplicates"] == []
+    assert _create(client, auth, "What is the capital city of Australia?").json["duplicates"] == []
+
+
+def test_reworded_question_is_reported(client, dataset, auth):
+    original = _create(client, auth, "What is the capital city of Australia?").json
+
+    response = _create(client, auth, "Australia: capital city?")
+
+    assert response.status_code == 201
+    matches = response.json["duplicates"]
+    assert matches[0]["id"] == original["id"]
+    assert 0.5 <= matches[0]["similarity"] <= 1.0
+
+
+def test_unrelated_question_is_not_reported(client, dataset, auth):
+    _create(client, auth, "What is the capital city of Australia?")
+
+    response = _create(client, auth, "Which enzyme unwinds DNA during replication?")
+
+    assert response.status_code == 201
+    assert response.json["duplicates"] == []
+
+
+def test_duplicate_check_can_be_disabled(app, client, dataset, auth):
+    app.config["DUPLICATE_CHECK_ENABLED"] = False
+    _create(client, auth, "What is the capital city of Australia?")
+
+    response = _create(client, auth, "Australia: capital city?")
+
+    assert response.status_code == 201
+    assert response.json["duplicates"] == []
+
+
+def test_other_users_cards_are_not_reported(client, dataset, auth):
+    other = client.post("/register", json={"username": "other", "password": "secret"})
+    assert other.status_code == 201
+    token = client.post("/login", json={"username": "other", "password": "secret"}).json["access_token"]
+    _create(client, {"Authorization": f"Bearer {token}"}, "What is the capital city of Australia?")
+
+    response = _create(client, auth, "Australia: capital city?")
+
+    assert response.json["duplicates"] == []
+
+
+def test_clusters(client, dataset, auth):
+    first = _create(client, auth, "What is the capital city of Australia?").json
+    second = _create(client, auth, "Australia: capital city?").json
+
+    response = client.get("/flashcard/duplicates", headers=auth)
+
+    assert response.status_code == 200
+    clusters = [{card["id"] for card in cluster["flashcards"]} for cluster in response.json]
+    assert any({first["id"], second["id"]} <= cluster for cluster in clusters)
+    assert all(0.5 <= cluster["similarity"] <= 1.0 for cluster in response.json)
+
+
+def test_clusters_are_reused_until_cards_change(client, dataset, auth, monkeypatch):
+    first = _create(client, auth, "What is the capital city of Australia?").json
+    _create(client, auth, "Australia: capital city?")
+    builds = []
+    build = duplicates._build_clusters
+    monkeypatch.setattr(duplicates, "_build_clusters", lambda user_id: builds.append(user_id) or build(user_id))
+
+    first_response = client.get("/flashcard/duplicates", headers=auth)
+    assert client.get("/flashcard/duplicates", headers=auth).json == first_response.json
+    assert len(builds) == 1
+
+    client.put(f"/flashcard/{first['id']}", json={"question": "Which enzyme unwinds DNA?"}, headers=auth)
+    response = client.get("/flashcard/duplicates", headers=auth)
+
+    assert len(builds) == 2
+    assert all(first["id"] not in {card["id"] for card in cluster["flashcards"]} for cluster in response.json)
+
+
+def test_reindex_invalidates_cached_clusters(app, client, dataset, auth, monkeypatch):
+    _create(client, auth, "What is the capital city of Australia?")
+    _create(client, auth, "Australia: capital city?")
+    assert client.get("/flashcard/duplicates", headers=auth).json
+
+    # `flask reindex-duplicates` runs in another process and records no card changes
+    with app.app_context():
+        QuestionBucketModel.query.delete()
+        db.session.commit()
+        duplicates.reindex_all()
+    builds = []
+    build = duplicates._build_clusters
+    monkeypatch.setattr(duplicates, "_build_clusters", lambda user_id: builds.append(user_id) or build(user_id))
+
+    assert client.get("/flashcard/duplicates", headers=auth).json
+    assert len(builds) == 1
+
+
+def test_update_reindexes_question(client, dataset, auth):
+    original = _create(client, auth, "What is the capital city of Australia?").json
+    reworded = _create(client, auth, "Which enzyme unwinds DNA during replication?").json
+    client.put(f"/flashcard/{reworded['id']}", json={"question": "Capital city of Australia?"}, headers=auth)
+
+    response = _create(client, auth, "Australia: capital city?")
+
+    assert {match["id"] for match in response.json["duplicates"]} == {original["id"], reworded["id"]}
+
+
+def test_delete_removes_buckets(app, client, dataset, auth):
+    card = _create(client, auth, "What is the capital city of Australia?").json
+    assert _buckets_of(app, card["id"]) == duplicates.BANDS
+
+    client.delete(f"/flashcard/{card['id']}", headers=auth)
+
+    assert _buckets_of(app, card["id"]) == 0
+
+
+def test_reindex_all(app, client, user, dataset):
+    with app.app_context():
+        QuestionBucketModel.query.delete()
+        db.session.commit()
+        duplicates.reindex_all()
+
+    assert _buckets_of(app, user["card_ids"][0]) == duplicates.BANDS
@@ -0,0 +1,267 @@
+"""
+GET /events: mutation handlers emit change events that reach open streams, streams resume from Last-Event-ID
+and the socket broker fans wakeups out between processes.
+"""
+import json
+import os
+import runpy
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from gunicorn.config import Config
+from sqlalchemy import event
+
+import events
+from db import db
+from models import TagModel
+
+
+@pytest.fixture(autouse=True)
+def short_streams(app):
+    app.config["EVENTS_MAX_STREAM_SECONDS"] = 0.3
+    app.config["EVENTS_HEARTBEAT_SECONDS"] = 0.1
+
+
+def _open(client, headers=None, url="/events"):
+    return client.get(url, headers=headers or {}, buffered=False)
+
+
+def _read(response):
+    """Consume the stream and return its events as dicts with id, event and data."""
+    frames = []
+    body = b"".join(response.response).decode()
+    response.close()
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            frames.append({"id": int(fields["id"]), "event": fields["event"], "data": json.loads(fields["data"])})
+    return frames
+
+
+def _create(client, auth, question):
+    return client.post("/flashcard", json={"question": question, "answer": "42"}, headers=auth).json
+
+
+def test_stream_delivers_changes(client, user, auth):
+    response = _open(client, auth)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    card = _create(client, auth, "What is the boiling point of water?")
+    client.put(f"/flashcard/{card['id']}", json={"answer": "100 C"}, headers=auth)
+    tag_id = user["tag_ids"][-1]
+    client.post(f"/flashcard/{card['id']}/tag/{tag_id}", headers=auth)
+    client.delete(f"/flashcard/{card['id']}/tag/{tag_id}", headers=auth)
+    client.delete(f"/flashcard/{card['id']}", headers=auth)
+
+    frames = _read(response)
+    assert [frame["event"] for frame in frames] == [
+        "tag.created", "flashcard.created", "flashcard.updated", "tag.linked", "tag.unlinked", "flashcard.deleted",
+    ]
+    assert frames[0]["data"] == {"tag_id": card["tags"][0]["id"]}  # The default tag
+    assert all(frame["data"]["flashcard_id"] == card["id"] for frame in frames[1:])
+    assert frames[3]["data"]["tag_id"] == tag_id
+    assert [frame["id"] for frame in frames] == sorted(frame["id"] for frame in frames)
+
+
+def test_fresh_stream_skips_history(client, dataset, auth):
+    _create(client, auth, "Old news?")
+    assert _read(_open(client, auth)) == []
+
+
+def test_resume_with_last_event_id(client, dataset, auth):
+    first = _create(client, auth, "First?")
+    second = _create(client, auth, "Second?")
+
+    history = _read(_open(client, {**auth, "Last-Event-ID": "0"}))
+    assert [frame["event"] for frame in history] == ["tag.created", "flashcard.created", "flashcard.created"]
+    assert [frame["data"]["flashcard_id"] for frame in history[1:]] == [first["id"], second["id"]]
+
+    resumed = _read(_open(client, {**auth, "Last-Event-ID": str(history[1]["id"])}))
+    assert [frame["data"]["flashcard_id"] for frame in resumed] == [second["id"]]
+
+
+def test_other_users_changes_are_not_streamed(client, dataset, auth):
+    client.post("/register", json={"username": "other", "password": "secret"})
+    token = client.post("/login", json={"username": "other", "password": "secret"}).json["access_token"]
+
+    response = _open(client, auth)
+    _create(client, {"Authorization": f"Bearer {token}"}, "Someone else's card?")
+
+    assert _read(response) == []
+
+
+def test_token_in_query_string(client, user, dataset):
+    response = _open(client, url=f"/events?jwt={user['token']}")
+    assert response.status_code == 200
+    assert _read(response) == []
+
+
+def test_requires_token(client, dataset):
+    assert client.get("/events").status_code == 401
+
+
+def test_open_streams_are_capped(app, client, dataset, auth):
+    app.config["EVENTS_MAX_STREAMS"] = 1
+    first = _open(client, auth)
+    assert first.status_code == 200
+
+    refused = client.get("/events", headers=auth)
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "2"
+
+    # Closing the first stream frees its slot
+    _read(first)
+    assert _read(_open(client, auth)) == []
+
+
+def test_stream_closed_before_reading_unsubscribes(app, client, dataset, auth):
+    with app.app_context():
+        broker = events.get_broker()
+
+    # The client went away before the server started sending the body
+    _open(client, auth).close()
+
+    assert not broker._subscriptions
+    assert _read(_open(client, auth)) == []  # And its slot is free again
+
+
+def test_access_log_redacts_tokens(monkeypatch):
+    monkeypatch.setenv("EVENTS_BROKER", "memory")
+    monkeypatch.setenv("EVENTS_MAX_STREAMS", "3")
+    conf = runpy.run_path(os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py"))
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "RAW_URI": "/events?last_event_id=4&jwt=secret.token",
+        "PATH_INFO": "/events",
+        "QUERY_STRING": "jwt=secret.token&last_event_id=4",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+    }
+    response = SimpleNamespace(status="200 OK", headers=[], sent=0)
+    atoms = conf["logger_class"](Config()).atoms(response, [], environ, timedelta(seconds=1))
+
+    assert atoms["r"] == "GET /events?last_event_id=4&jwt=[redacted] HTTP/1.1"
+    assert atoms["q"] == "jwt=[redacted]&last_event_id=4"
+    assert "secret.token" not in repr(atoms)
+
+
+def test_gunicorn_keeps_most_threads_for_the_api(monkeypatch):
+    monkeypatch.setenv("EVENTS_MAX_STREAMS", "3")
+    monkeypatch.delenv("EVENTS_MAX_STREAMS")
+    monkeypatch.setenv("EVENTS_BROKER", "socket")
+    monkeypatch.setenv("GUNICORN_THREADS", "8")
+    runpy.run_path(os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py"))
+    assert os.environ["EVENTS_MAX_STREAMS"] == "2"
+
+
+def test_rejects_bad_last_event_id(client, dataset, auth):
+    assert client.get("/events", headers={**auth, "Last-Event-ID": "abc"}).status_code == 400
+
+
+def test_reset_when_history_was_pruned(app, client, dataset, auth):
+    _create(client, auth, "Pruned?")
+    _create(client, auth, "Pruned too?")
+    with app.app_context():
+        assert events.prune(older_than_seconds=-1) == 3  # Two cards and their default tag
+    _create(client, auth, "Kept?")
+
+    frames = _read(_open(client, {**auth, "Last-Event-ID": "0"}))
+
+    assert [frame["event"] for frame in frames] == ["reset", "flashcard.created"]
+
+
+def test_reset_when_all_history_was_pruned(app, client, dataset, auth):
+    _create(client, auth, "Pruned?")
+    history = _read(_open(client, {**auth, "Last-Event-ID": "0"}))
+    _create(client, auth, "Pruned too?")
+    with app.app_context():
+        assert events.prune(older_than_seconds=-1) == 3  # Two cards and their default tag
+
+    frames = _read(_open(client, {**auth, "Last-Event-ID": str(history[-1]["id"])}))
+    assert [frame["event"] for frame in frames] == ["reset"]
+
+    # A client that had already seen everything loses nothing
+    assert _read(_open(client, {**auth, "Last-Event-ID": str(history[-1]["id"] + 1)})) == []
+
+
+def test_rolled_back_changes_are_not_published(app, user, dataset):
+    with app.app_context():
+        subscription = events.get_broker().subscribe(user["id"])
+        events.record(user["id"], "flashcard.updated", flashcard_id="x")
+        db.session.rollback()
+        assert not subscription.wait(0)
+
+        events.record(user["id"], "flashcard.updated", flashcard_id="x")
+        db.session.commit()
+        assert subscription.wait(0)
+        subscription.close()
+
+
+def test_conflicting_tag_is_rejected_without_event(client, user, auth):
+    response = _open(client, auth)
+
+    # Another request creates the same tag between the duplicate check and the insert
+    @event.listens_for(db.session, "before_flush", once=True)
+    def concurrent_create(session, flush_context, instances):
+        session.connection().execute(
+            TagModel.__table__.insert().values(id=uuid.uuid4(), name="Racing", user_id=user["id"])
+        )
+
+    assert client.post("/tag", json={"name": "Racing"}, headers=auth).status_code == 400
+    assert _read(response) == []
+
+
+def test_tag_created_on_flashcard(client, user, auth):
+    response = _open(client, auth)
+    card_id = user["card_ids"][0]
+    tag = client.post(f"/flashcard/{card_id}/tag", json={"name": "Brand new"}, headers=auth)
+    assert tag.status_code == 201
+    assert [(frame["event"], frame["data"]) for frame in _read(response)] == [
+        ("tag.created", {"tag_id": tag.json["id"]}),
+        ("tag.linked", {"flashcard_id": card_id, "tag_id": tag.json["id"]}),
+    ]
+
+
+def test_existing_tag_on_flashcard_is_not_created_again(client, user, auth):
+    tag_id = client.post("/tag", json={"name": "Existing"}, headers=auth).json["id"]
+    response = _open(client, auth)
+    card_id = user["card_ids"][0]
+    assert client.post(f"/flashcard/{card_id}/tag", json={"name": "Existing"}, headers=auth).status_code == 201
+    assert [(frame["event"], frame["data"]) for frame in _read(response)] == [
+        ("tag.linked", {"flashcard_id": card_id, "tag_id": tag_id}),
+    ]
+
+
+def test_tags_created_with_flashcard(client, user, auth):
+    response = _open(client, auth)
+    card = client.post(
+        "/flashcard",
+        json={"question": "What is the speed of light?", "answer": "c", "tags": [user["tag_names"][0], "physics"]},
+        headers=auth,
+    ).json
+    default = _create(client, auth, "What is Planck's constant?")
+
+    frames = _read(response)
+    new_tag_ids = {tag["id"] for tag in card["tags"] if tag["name"] == "physics"}
+    new_tag_ids |= {tag["id"] for tag in default["tags"]}
+    assert [frame["event"] for frame in frames] == ["tag.created", "flashcard.created"] * 2
+    assert {frame["data"]["tag_id"] for frame in frames if frame["event"] == "tag.created"} == new_tag_ids
+
+
+def test_socket_broker_fans_out_between_workers(app, tmp_path):
+    app.config["EVENTS_SOCKET_DIR"] = str(tmp_path / "events")
+    worker_a = events.UnixSocketBroker(app)
+    worker_b = events.UnixSocketBroker(app)
+    try:
+        subscription = worker_a.subscribe("user-1")
+        other = worker_a.subscribe("user-2")
+
+        worker_b.publish("user-1")
+
+        assert subscription.wait(2)
+        assert not other.wait(0.1)
+    finally:
+        worker_a.close()
+        worker_b.close()
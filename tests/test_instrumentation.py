@@ -0,0 +1,160 @@
+"""
+Request instrumentation: Server-Timing headers, the JSON request log, /metrics and the N+1 detector.
+"""
+import json
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from db import db
+from instrumentation import MetricsRegistry, statement_shape
+
+pytestmark = pytest.mark.instrument
+
+METRICS_AUTH = {"Authorization": "Bearer scraper-secret"}
+
+
+@pytest.fixture(autouse=True)
+def metrics_token(app):
+    app.config["METRICS_TOKEN"] = "scraper-secret"
+
+
+def _log_lines(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records
+            if record.name == "flashcards.instrumentation" and record.levelno == logging.INFO]
+
+
+def _sample(metrics, line_start):
+    """The value of the first /metrics sample line starting with `line_start`, or 0."""
+    for line in metrics.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_server_timing_header(client, auth):
+    response = client.get("/flashcard", headers=auth)
+    assert response.status_code == 200
+
+    entries = dict(entry.split(";", 1) for entry in response.headers["Server-Timing"].split(", "))
+    assert set(entries) == {"db", "db-slowest", "serialize", "jwt", "total"}
+    assert entries["db"].startswith("dur=") and entries["db"].endswith(' queries"')
+    queries = int(entries["db"].split('desc="')[1].split()[0])
+    assert queries > 0
+
+
+def test_request_is_logged_as_json(client, auth, caplog):
+    with caplog.at_level(logging.INFO, logger="flashcards.instrumentation"):
+        response = client.get("/flashcard", headers=auth)
+
+    [line] = _log_lines(caplog)
+    assert line["event"] == "request"
+    assert line["method"] == "GET"
+    assert line["route"] == "/flashcard"
+    assert line["status"] == response.status_code
+    assert line["db_queries"] > 0
+    assert line["db_slowest_statement"].startswith("SELECT")
+    assert line["jwt_ms"] >= 0 and line["duration_ms"] >= line["db_time_ms"]
+
+
+def test_metrics_endpoint(client, auth):
+    before = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+    client.get("/flashcard", headers=auth)
+    client.get("/flashcard", headers=auth)
+
+    response = client.get("/metrics", headers=METRICS_AUTH)
+    assert response.mimetype == "text/plain"
+    metrics = response.get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in metrics
+    assert "# TYPE db_queries_total counter" in metrics
+
+    count = 'http_request_duration_seconds_count{method="GET",route="/flashcard"}'
+    assert _sample(metrics, count) - _sample(before, count) == 2
+    inf = 'http_request_duration_seconds_bucket{method="GET",route="/flashcard",le="+Inf"}'
+    assert _sample(metrics, inf) == _sample(metrics, count)
+    queries = 'db_queries_total{route="/flashcard"}'
+    assert _sample(metrics, queries) > _sample(before, queries)
+
+
+def test_metrics_requires_the_token(app, client, auth):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=auth).status_code == 401  # A user's access token is not enough
+    assert client.get("/metrics", headers={"Authorization": "Bearer scraper-secreT"}).status_code == 401
+
+    app.config["METRICS_TOKEN"] = None
+    assert client.get("/metrics", headers=METRICS_AUTH).status_code == 404
+
+
+def test_metrics_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("jobs_total", "Jobs run.")
+    registry.histogram("job_seconds", "Job duration.", buckets=(0.1, 1.0))
+    registry.gauge("queue_depth", "Queued jobs.", lambda: {(("queue", 'say "hi"'),): 3})
+    registry.inc("jobs_total", kind="import")
+    registry.inc("jobs_total", 2, kind="import")
+    registry.observe("job_seconds", 0.5)
+
+    assert registry.render().splitlines() == [
+        "# HELP job_seconds Job duration.",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{le="0.1"} 0',
+        'job_seconds_bucket{le="1.0"} 1',
+        'job_seconds_bucket{le="+Inf"} 1',
+        "job_seconds_sum 0.5",
+        "job_seconds_count 1",
+        "# HELP jobs_total Jobs run.",
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="import"} 3.0',
+        "# HELP queue_depth Queued jobs.",
+        "# TYPE queue_depth gauge",
+        'queue_depth{queue="say \\"hi\\""} 3.0',
+    ]
+
+
+def test_statement_shape():
+    assert statement_shape("SELECT * FROM tags WHERE name = 'it''s'  AND  id = 42") == (
+        "SELECT * FROM tags WHERE name = ? AND id = ?"
+    )
+    assert statement_shape("SELECT * FROM tags WHERE id IN (?, ?, ?)") == statement_shape(
+        "SELECT * FROM tags WHERE id IN (?)"
+    )
+    assert statement_shape("SELECT 1.5 FROM t1") == "SELECT ? FROM t1"
+
+
+@pytest.mark.parametrize("placeholders", [
+    ["%(id_1_1)s", "%(id_1_2)s", "%(id_1_3)s"],  # psycopg2
+    ["%s", "%s"],
+    ["$1", "$2", "$3", "$4"],  # asyncpg
+])
+def test_statement_shape_collapses_postgres_in_lists(placeholders):
+    statement = f"SELECT * FROM tags WHERE user_id = %(user_id)s AND id IN ({', '.join(placeholders)})"
+    assert statement_shape(statement) == "SELECT * FROM tags WHERE user_id = ? AND id IN (?)"
+
+
+@pytest.mark.parametrize("lookups, warned", [(5, False), (6, True)])
+def test_n_plus_one_warning(app, client, caplog, lookups, warned):
+    # One lookup per row with a different literal each time: the statements differ, their shape does not
+    def one_query_per_row():
+        for i in range(lookups):
+            db.session.execute(text(f"SELECT id FROM users WHERE id = '{i}'"))
+        return {}
+
+    app.add_url_rule("/n-plus-one", "n_plus_one", one_query_per_row)
+    assert app.config["INSTRUMENTATION_N_PLUS_ONE_THRESHOLD"] == 5
+
+    before = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+    with caplog.at_level(logging.INFO, logger="flashcards.instrumentation"):
+        client.get("/n-plus-one")
+    after = client.get("/metrics", headers=METRICS_AUTH).get_data(as_text=True)
+
+    warnings = [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING]
+    counter = 'db_n_plus_one_warnings_total{route="/n-plus-one"}'
+    if warned:
+        assert warnings == [
+            f"Possible N+1 in GET /n-plus-one: statement ran {lookups} times: SELECT id FROM users WHERE id = ?"
+        ]
+        assert _sample(after, counter) - _sample(before, counter) == 1
+    else:
+        assert warnings == []
+        assert _sample(after, counter) == _sample(before, counter)
@@ -0,0 +1,70 @@
+"""
+Migrations applied to a populated SQLite database, the default DATABASE_URL.
+"""
+import uuid
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import text
+
+from app import create_app
+from db import db
+
+
+@pytest.fixture
+def migrated_app(tmp_path):
+    app = create_app(f"sqlite:///{tmp_path / 'migrated.db'}")
+    with app.app_context():
+        upgrade(directory="migrations", revision="7399ecff8561")
+    return app
+
+
+def _populate(users=2, cards_per_user=50):
+    user_ids = []
+    for u in range(users):
+        user_id = str(uuid.uuid4())
+        user_ids.append(user_id)
+        db.session.execute(
+            text("INSERT INTO users (id, username, password, is_admin) VALUES (:id, :name, 'x', 0)"),
+            {"id": user_id, "name": f"user-{u}"},
+        )
+        tag_id = uuid.uuid4().hex
+        db.session.execute(
+            text("INSERT INTO tags (id, name, user_id) VALUES (:id, 'tag', :user_id)"),
+            {"id": tag_id, "user_id": user_id},
+        )
+        for c in range(cards_per_user):
+            card_id = uuid.uuid4().hex
+            db.session.execute(
+                text("INSERT INTO flashcards (id, question, answer, user_id, created_at) "
+                     "VALUES (:id, :question, 'a', :user_id, CURRENT_TIMESTAMP)"),
+                {"id": card_id, "question": f"Question {c}?", "user_id": user_id},
+            )
+            db.session.execute(
+                text("INSERT INTO flashcards_tags (flashcard_id, tag_id, id) VALUES (:card_id, :tag_id, :id)"),
+                {"card_id": card_id, "tag_id": tag_id, "id": uuid.uuid4().hex},
+            )
+    db.session.commit()
+    return user_ids
+
+
+def test_random_key_backfill_is_uniform_on_sqlite(migrated_app):
+    with migrated_app.app_context():
+        _populate()
+        upgrade(directory="migrations", revision="176cace66be6")
+
+        for table in ("flashcards", "flashcards_tags"):
+            keys = db.session.execute(text(f"SELECT random_key FROM {table}")).scalars().all()
+            assert len(keys) == 100
+            assert all(0.0 <= key < 1.0 for key in keys), table
+            assert len(set(keys)) == len(keys)
+            # 100 uniform draws: both halves of the range are populated
+            assert 20 < sum(key < 0.5 for key in keys) < 80
+
+
+def test_upgrade_to_head_on_populated_sqlite(migrated_app):
+    with migrated_app.app_context():
+        _populate(users=1, cards_per_user=5)
+        upgrade(directory="migrations")
+
+        assert db.session.execute(text("SELECT count(*) FROM flashcards")).scalar() == 5
@@ -0,0 +1,240 @@
+"""
+Query-count guardrails for every route in resources/. Each test runs against every dataset size in
+conftest.DATASET_SIZES with the same bound, so a handler whose query count grows with the data fails here.
+"""
+import io
+import uuid
+
+import pytest
+from flask_jwt_extended import create_refresh_token
+
+import attachments
+from db import db
+from models import AttachmentModel, FlashCardModel, FlashCardsTags, TagModel
+
+
+def _auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def card_id(user):
+    return user["card_ids"][0]
+
+
+@pytest.fixture
+def tag_id(user):
+    return user["tag_ids"][0]
+
+
+@pytest.fixture
+def new_tag(app, user):
+    """Create a tag of the seeded user that is not linked to any card."""
+    def create(name):
+        with app.app_context():
+            tag = TagModel(name=name, user_id=user["id"])
+            db.session.add(tag)
+            db.session.commit()
+            return str(tag.id)
+    return create
+
+
+# Users
+
+@pytest.mark.max_queries(3)
+def test_register(client, dataset):
+    response = client.post("/register", json={"username": "new-user", "password": "secret"})
+    assert response.status_code == 201
+
+
+@pytest.mark.max_queries(2)
+def test_login(client, user, dataset):
+    response = client.post("/login", json={"username": user["username"], "password": dataset["password"]})
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(1)
+def test_refresh(app, client, user):
+    with app.app_context():
+        token = create_refresh_token(identity=user["id"])
+    response = client.post("/refresh", headers=_auth(token))
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(0)
+def test_logout(client, auth):
+    response = client.post("/logout", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(3)
+def test_get_user(client, user, auth):
+    response = client.get(f"/user/{user['id']}", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(9)
+def test_delete_user(app, client, user, auth):
+    response = client.delete(f"/user/{user['id']}", headers=auth)
+    assert response.status_code == 200
+    with app.app_context():
+        card_ids = [uuid.UUID(card_id) for card_id in user["card_ids"]]
+        assert FlashCardsTags.query.filter(FlashCardsTags.flashcard_id.in_(card_ids)).count() == 0
+
+
+# Flashcards
+
+@pytest.mark.max_queries(2)
+def test_list_flashcards(client, user, auth):
+    response = client.get("/flashcard", headers=auth)
+    assert response.status_code == 200
+    assert len(response.json) == len(user["card_ids"])
+
+
+@pytest.mark.max_queries(13)
+def test_create_flashcard(client, user, auth):
+    response = client.post(
+        "/flashcard",
+        json={"question": "A new question?", "answer": "An answer", "tags": [user["tag_names"][0], "brand-new"]},
+        headers=auth,
+    )
+    assert response.status_code == 201
+
+
+@pytest.mark.max_queries(3)
+def test_get_flashcard(client, card_id, auth):
+    response = client.get(f"/flashcard/{card_id}", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(6)
+def test_update_flashcard(client, card_id, auth):
+    response = client.put(f"/flashcard/{card_id}", json={"answer": "Updated"}, headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(9)
+def test_update_flashcard_question(client, card_id, auth):
+    response = client.put(f"/flashcard/{card_id}", json={"question": "A reworded question?"}, headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(6)
+def test_delete_flashcard(client, card_id, auth):
+    response = client.delete(f"/flashcard/{card_id}", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(3)
+def test_list_duplicates(client, auth):
+    response = client.get("/flashcard/duplicates", headers=auth)
+    assert response.status_code == 200
+
+
+# Attachments
+
+@pytest.fixture
+def attachment(app, card_id):
+    with app.app_context():
+        sha256, size = attachments.get_store().save(io.BytesIO(b"GIF89a"), max_bytes=1024)
+        attachment = AttachmentModel(flashcard_id=uuid.UUID(card_id), sha256=sha256, size=size, content_type="image/gif")
+        db.session.add(attachment)
+        db.session.commit()
+        return str(attachment.id)
+
+
+@pytest.mark.max_queries(4)
+def test_upload_attachment(client, card_id, auth):
+    response = client.post(f"/flashcard/{card_id}/attachment", data=b"GIF89a", headers={**auth, "Content-Type": "image/gif"})
+    assert response.status_code == 201
+
+
+@pytest.mark.max_queries(2)
+def test_list_attachments(client, card_id, auth):
+    response = client.get(f"/flashcard/{card_id}/attachment", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(1)
+def test_download_attachment(client, attachment, auth):
+    response = client.get(f"/attachment/{attachment}", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(3)
+def test_delete_attachment(client, attachment, auth):
+    response = client.delete(f"/attachment/{attachment}", headers=auth)
+    assert response.status_code == 200
+
+
+# Tags
+
+@pytest.mark.max_queries(2)
+def test_list_tags(client, user, auth):
+    response = client.get("/tag", headers=auth)
+    assert response.status_code == 200
+    assert len(response.json) == len(user["tag_ids"])
+
+
+@pytest.mark.max_queries(5)
+def test_create_tag(client, auth):
+    response = client.post("/tag", json={"name": "fresh"}, headers=auth)
+    assert response.status_code == 201
+
+
+@pytest.mark.max_queries(2)
+def test_get_tag(client, tag_id, auth):
+    response = client.get(f"/tag/{tag_id}", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(5)
+def test_delete_tag(client, new_tag, auth):
+    response = client.delete(f"/tag/{new_tag('unused')}", headers=auth)
+    assert response.status_code == 202
+
+
+@pytest.mark.max_queries(3)
+def test_delete_linked_tag_is_rejected(client, tag_id, auth):
+    response = client.delete(f"/tag/{tag_id}", headers=auth)
+    assert response.status_code == 400
+
+
+@pytest.mark.max_queries(3)
+def test_list_flashcard_tags(client, card_id, auth):
+    response = client.get(f"/flashcard/{card_id}/tag", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(6)
+def test_add_tag_to_flashcard_by_name(client, card_id, new_tag, auth):
+    name = f"by-name-{uuid.uuid4().hex[:8]}"
+    new_tag(name)
+    response = client.post(f"/flashcard/{card_id}/tag", json={"name": name}, headers=auth)
+    assert response.status_code == 201
+
+
+@pytest.mark.max_queries(6)
+def test_link_tag(client, card_id, new_tag, auth):
+    response = client.post(f"/flashcard/{card_id}/tag/{new_tag('link-me')}", headers=auth)
+    assert response.status_code == 200
+
+
+@pytest.mark.max_queries(8)
+def test_unlink_tag(app, client, user, auth):
+    with app.app_context():
+        card = db.session.get(FlashCardModel, uuid.UUID(user["card_ids"][0]))
+        tag_id = card.tags[0].id
+
+    response = client.delete(f"/flashcard/{card.id}/tag/{tag_id}", headers=auth)
+    assert response.status_code == 200
+
+
+# Events
+
+@pytest.mark.max_queries(3)
+def test_event_stream(app, client, auth):
+    app.config["EVENTS_MAX_STREAM_SECONDS"] = 0
+    response = client.get("/events", headers={**auth, "Last-Event-ID": "0"}, buffered=False)
+    assert response.status_code == 200
+    assert b"retry:" in b"".join(response.response)